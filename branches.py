@@ -0,0 +1,151 @@
+'''
+Generate the branches of an isocontour tree in parallel
+
+Sibling branches of the tree do not depend on each other, only on their parent when they are joined to it.
+Every contour family of the tree is submitted to a worker pool at once, and each node is merged with its
+children as soon as its own path and the merged paths of all of its children are finished
+'''
+
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from contour_tree import ContourTree
+
+
+'''
+Split an isocontour tree (nested lists or a ContourTree) into nodes ~ returns a list of (contour family, child node indices, branch) in pre-order
+ - the children of each node keep the order of the branches in the tree
+ - branch: the nested list of the node and its descendants (None for a ContourTree), used as its cache key
+'''
+def flatten(isocontours):
+
+    if isinstance(isocontours, ContourTree):
+        return [(isocontours.family(b), isocontours.children[b], None) for b in range(len(isocontours))]
+
+    nodes = []
+
+    stack = [(isocontours, None)]
+
+    while stack:
+        branch, parent = stack.pop()
+
+        index = len(nodes)
+        nodes.append(([node for node in branch if not type(node) is list], [], branch))
+
+        if not parent is None:
+            nodes[parent][1].append(index)
+
+        # pushed in reverse so the first branch is visited (and numbered) first
+        for child in [node for node in branch if type(node) is list][::-1]:
+            stack.append((child, index))
+
+    return nodes
+
+
+'''
+Generate the path of one contour family in a worker ~ returns the path and the fallbacks recorded by a fork of the budget
+'''
+def generate_node(generate, contour_family, distance, budget=None):
+
+    if budget is None:
+        return generate(contour_family, distance), []
+
+    budget = budget.fork()
+
+    return generate(contour_family, distance, budget=budget), budget.fallbacks
+
+
+'''
+Merge the separate paths of the branches before the path of their root (spiral and fermat spiral)
+'''
+def merge_separate(path, branches, distance):
+
+    total_path = []
+
+    for branch in branches:
+        total_path.extend(branch)
+
+    total_path.append(path)
+
+    return total_path
+
+
+'''
+Generate the path of an isocontour tree with the nodes running in parallel
+ - generate: function(contour family, distance, budget=None) that builds the path of one contour family
+ - merge: function(path, merged branches, distance) that joins the path of a node with the merged paths of its children
+ - cache, method: the merged path of each branch of nested lists is cached under its own key, as in the recursive path ~ the caller caches the whole tree
+ - the result is the same as running the tree recursively
+'''
+def generate_tree(isocontours, distance, executor, generate, merge, budget=None, cache=None, method=None):
+
+    nodes = flatten(isocontours)
+
+    parents = {child: i for i, (_, children, _) in enumerate(nodes) for child in children}
+
+    keys = {}
+    merged = {}
+
+    if not cache is None:
+        keys = {i: cache.key(branch, distance, method) for i, (_, _, branch) in enumerate(nodes) if i and not branch is None}
+
+    # the descendants of a cached branch are not generated ~ parents come before their children in pre-order
+    skipped = set()
+
+    for i in range(1, len(nodes)):
+        if parents[i] in skipped or parents[i] in merged:
+            skipped.add(i)
+        elif i in keys:
+            path = cache.get(keys[i])
+
+            if not path is None:
+                merged[i] = path
+
+    # every contour family is independent, so they all start at once
+    pending = {executor.submit(generate_node, generate, family, distance, budget): ("generate", i)
+               for i, (family, _, _) in enumerate(nodes) if not i in skipped and not i in merged}
+
+    paths = {}
+
+    # branches with fallbacks are not cached, a later run with a larger budget may find a valid path
+    fell_back = set()
+
+    while pending:
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+
+            task, i = pending.pop(future)
+
+            if task == "generate":
+                paths[i], fallbacks = future.result()
+
+                if fallbacks:
+                    fell_back.add(i)
+
+                if not budget is None:
+                    budget.fallbacks.extend(fallbacks)
+            else:
+                merged[i] = future.result()
+
+                if any(child in fell_back for child in nodes[i][1]):
+                    fell_back.add(i)
+
+                if i in keys and not i in fell_back:
+                    cache.put(keys[i], merged[i])
+
+                # the branches are not needed once they are merged into their parent
+                for child in nodes[i][1]:
+                    del merged[child]
+
+                if not i in parents:
+                    continue
+
+                i = parents[i]
+
+            # merge the node once its path and all of its children are finished
+            if i in paths and all(child in merged for child in nodes[i][1]):
+                branches = [merged[child] for child in nodes[i][1]]
+                pending[executor.submit(merge, paths.pop(i), branches, distance)] = ("merge", i)
+
+    return merged[0]
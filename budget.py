@@ -0,0 +1,82 @@
+'''
+Time and attempt budgets for the start index retry loops
+
+The spiral and fermat generators retry with a new start index until the path is valid. With a budget,
+they keep the best attempt so far and return it once the budget runs out, recording the fallback
+'''
+
+from time import perf_counter
+
+
+class Budget:
+
+    '''
+    seconds: time allowed per polygon (None for no limit)
+    attempts: start index attempts allowed per retry loop (None for no limit)
+    '''
+
+    def __init__(self, seconds=None, attempts=None):
+
+        assert seconds is None or seconds > 0
+        assert attempts is None or attempts > 0
+
+        self.seconds = seconds
+        self.attempts = attempts
+
+        self.polygon = None
+        self.deadline = None
+
+        # one dictionary per retry loop that returned its best attempt instead of a valid path
+        self.fallbacks = []
+
+
+    '''
+    Start the clock for the next polygon
+    '''
+    def start(self, polygon):
+
+        self.polygon = polygon
+
+        if not self.seconds is None:
+            self.deadline = perf_counter() + self.seconds
+
+
+    '''
+    Copy with the same limits, polygon and clock but its own fallbacks ~ for a task whose fallbacks are returned separately
+    '''
+    def fork(self):
+
+        budget = Budget(self.seconds, self.attempts)
+        budget.polygon = self.polygon
+        budget.deadline = self.deadline
+
+        return budget
+
+
+    '''
+    True if the retry loop should stop after this many attempts
+     - limit: number of possible start indices, there is nothing left to try past it
+    '''
+    def exhausted(self, attempts, limit=None):
+
+        if not limit is None and attempts >= limit:
+            return True
+
+        if not self.attempts is None and attempts >= self.attempts:
+            return True
+
+        return not self.deadline is None and perf_counter() >= self.deadline
+
+
+    '''
+    Record a retry loop that returned its best attempt
+    '''
+    def fall_back(self, method, attempts, intersections, ratio=None):
+
+        self.fallbacks.append({
+            "Polygon": self.polygon,
+            "Method": method,
+            "Attempts": attempts,
+            "Intersections": intersections,
+            "Ratio": ratio,
+        })
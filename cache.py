@@ -0,0 +1,212 @@
+'''
+Content-addressed cache for isocontours and generated paths
+
+Results are keyed by a hash of the geometry WKB, the distance and the method. Entries are kept in an
+in-memory LRU and optionally in a directory on disk, both with a size cap
+'''
+
+import os
+import pickle
+import hashlib
+
+from collections import OrderedDict
+
+import numpy as np
+
+from shapely.affinity import translate
+
+from shapely_utilities import distance_transform_diff
+from contour_tree import ContourTree
+
+
+class ResultCache:
+
+    '''
+    directory: folder to store the entries on disk (memory only if None)
+    max_items: number of entries kept in memory
+    max_bytes: total size of the entries kept on disk
+    namespace: added to every key, so results generated with different settings are kept apart
+    '''
+
+    def __init__(self, directory=None, max_items=1024, max_bytes=256*1024*1024, namespace=""):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+
+        self.memory = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        if not directory is None:
+            os.makedirs(directory, exist_ok=True)
+
+
+    '''
+    Hash a geometry, a nested list of geometries (an isocontour branch) or a ContourTree with the distance and method
+    '''
+    def key(self, geometry, distance, method):
+
+        h = hashlib.sha256()
+        h.update(self.namespace.encode())
+        h.update(method.encode())
+        h.update(repr(float(distance)).encode())
+
+        # walk the nested lists without recursion ~ brackets keep the tree structure in the hash
+        stack = [geometry]
+
+        while stack:
+            item = stack.pop()
+
+            if type(item) is list:
+                h.update(b"[")
+                stack.append(None)
+                stack.extend(item[::-1])
+            elif item is None:
+                h.update(b"]")
+            elif isinstance(item, ContourTree):
+                h.update(b"tree")
+                h.update(item.tobytes())
+            else:
+                h.update(item.wkb)
+
+        return h.hexdigest()
+
+
+    '''
+    Path of an entry on disk
+    '''
+    def _file(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+
+    '''
+    Get an entry ~ returns None on a miss
+    '''
+    def get(self, key):
+
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        if not self.directory is None and os.path.exists(self._file(key)):
+
+            with open(self._file(key), "rb") as f:
+                value = pickle.load(f)
+
+            # refresh the modification time so the disk eviction is least recently used
+            os.utime(self._file(key))
+
+            self._store(key, value)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+
+    '''
+    Add an entry to memory, evicting the least recently used entries over the cap
+    '''
+    def _store(self, key, value):
+
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+
+    '''
+    Add an entry to memory and disk
+    '''
+    def put(self, key, value):
+
+        self._store(key, value)
+
+        if self.directory is None:
+            return
+
+        # write to a temporary file first so readers never see a partial entry
+        temp = self._file(key) + ".tmp"
+
+        with open(temp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp, self._file(key))
+
+        self.evict()
+
+
+    '''
+    Remove the oldest entries on disk until the total size is under the cap
+    '''
+    def evict(self):
+
+        entries = []
+
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, name in entries:
+
+            if total <= self.max_bytes:
+                break
+
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+
+    '''
+    Get an entry, or compute and store it on a miss
+    '''
+    def get_or_compute(self, key, function, *args):
+
+        value = self.get(key)
+
+        if value is None:
+            value = function(*args)
+            self.put(key, value)
+
+        return value
+
+
+    '''
+    Cached distance_transform_diff
+    '''
+    def isocontours(self, polygon, distance):
+        return self.get_or_compute(self.key(polygon, distance, "isocontours"), distance_transform_diff, polygon, distance)
+
+
+'''
+Move a polygon so the minimum corner of its bounds is at the origin ~ identical shapes at different positions share cache entries
+'''
+def normalize(polygon):
+
+    minx, miny, _, _ = polygon.bounds
+
+    return translate(polygon, -minx, -miny), (minx, miny)
+
+
+'''
+Move the points of a path (or a nested list of paths) by an offset
+'''
+def translate_paths(paths, offset):
+
+    dx, dy = offset
+
+    if dx == 0 and dy == 0:
+        return paths
+
+    if type(paths) is list:
+        return [translate_paths(p, offset) for p in paths]
+
+    return paths + np.array([dx, dy])
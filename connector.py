@@ -0,0 +1,189 @@
+'''
+Splice the branch paths of a connected fermat spiral into their root in one pass
+
+The root is indexed once as a PreparedLine: an STRtree over its segments gives the nearest segment of a point, and the
+arc length at the start of each segment turns that into a position along the root (the same value as LineString.project).
+Every branch is then turned into an interval of the root that it replaces, and the intervals that do not
+overlap are assembled into the connected path in a single linear pass
+'''
+
+from bisect import bisect_left
+
+import numpy as np
+
+import shapely
+from shapely.geometry import Point, LineString
+
+from spiral import calculate_point
+from prepared import PreparedLine
+
+
+# distance at which a piece of the root passes through the splice point ~ a module setting like the spiral tolerances (engine.configure)
+SPLICE_TOLERANCE = 0.5e-6
+
+
+class RootIndex(PreparedLine):
+
+    '''
+    Get the part of the root within the radius of a point on segment k that contains the point
+     - only the run of segments around k that reach the circle is intersected, not the whole root
+    '''
+    def local_piece(self, point, k, radius):
+
+        int_buff = point.buffer(radius)
+
+        hits = set(self.tree.query(int_buff, predicate="intersects").tolist())
+
+        first = k
+        while first - 1 in hits:
+            first -= 1
+
+        last = k
+        while last + 1 in hits:
+            last += 1
+
+        possible_line = int_buff.intersection(LineString(self.coords[first:last+2]))
+
+        if possible_line.geom_type == "LineString":
+            return possible_line
+
+        for item in possible_line.geoms:
+
+            if item.geom_type == "LineString":
+                # need to use this check instead of intersects because intersects will return false for some reason
+                test = item.interpolate(item.project(point))
+
+                if test.equals_exact(point, SPLICE_TOLERANCE):
+                    return item
+
+        return None
+
+
+'''
+Find the interval of the root that each branch replaces ~ returns a list of (low position, high position, branch path) with None for the branches that can not be placed
+ - the cases follow the sequential splice of combine_paths (branches at the start or end of the root are moved away from the endpoint)
+'''
+def splice_intervals(index, branches, dis):
+
+    ends = [Point(b[-1]) for b in branches]
+
+    # project every end onto the root at once, and find the point on the root for each
+    end_k = index.nearest(ends)
+    end_dis = index.arc[end_k] + shapely.line_locate_point(index.segments[end_k], np.asarray(ends, dtype=object))
+
+    points = shapely.points(index.interpolate(end_dis))
+
+    intervals = []
+
+    for b, point, k, end_cut_dis in zip(branches, points, end_k, end_dis):
+
+        piece = index.local_piece(point, k, dis)
+
+        if piece is None:
+            intervals.append(None)
+            continue
+
+        start_pt = piece.interpolate(piece.project(Point(b[0])))
+        start_cut_dis = index.project([start_pt])[0]
+
+        # if the start is 0
+        if start_cut_dis == 0:
+            new_end = calculate_point(index.line, 0, dis, True)
+            intervals.append((0, index.project([new_end])[0], b))
+
+        # if the end is at the start
+        elif end_cut_dis == 0:
+            new_end = calculate_point(index.line, 0, dis, True)
+            intervals.append((0, index.project([new_end])[0], b[::-1]))
+
+        # if the start is at the end
+        elif start_cut_dis == index.length:
+            new_end = calculate_point(index.line, index.length, dis, False)
+            intervals.append((index.project([new_end])[0], index.length, b[::-1]))
+
+        # if the end is at the end
+        elif end_cut_dis == index.length:
+            new_end = calculate_point(index.line, index.length, dis, False)
+            intervals.append((index.project([new_end])[0], index.length, b))
+
+        elif start_cut_dis < end_cut_dis:
+            intervals.append((start_cut_dis, end_cut_dis, b))
+        else:
+            intervals.append((end_cut_dis, start_cut_dis, b[::-1]))
+
+    return intervals
+
+
+'''
+Keep the intervals that do not overlap an earlier branch ~ returns the accepted intervals sorted by position and the indices of the conflicting branches
+'''
+def resolve_conflicts(intervals):
+
+    accepted = []
+    conflicts = []
+
+    # low positions of the accepted intervals, kept sorted to check only the neighbours of each new interval
+    lows = []
+
+    for i, interval in enumerate(intervals):
+
+        if interval is None:
+            conflicts.append(i)
+            continue
+
+        lo, hi, _ = interval
+
+        j = bisect_left(lows, lo)
+
+        # touching intervals also conflict, both would cut the root at the same point
+        if (j > 0 and lo <= accepted[j-1][1]) or (j < len(lows) and lows[j] <= hi):
+            conflicts.append(i)
+        else:
+            lows.insert(j, lo)
+            accepted.insert(j, interval)
+
+    return accepted, conflicts
+
+
+'''
+Build the connected path from the root and the sorted, non overlapping intervals in a single pass
+ - the root is cut at each position the same way cut does (a position on a vertex keeps the vertex, otherwise the interpolated point is added)
+'''
+def assemble(index, intervals):
+
+    if not intervals:
+        return index.coords
+
+    positions = np.array([[lo, hi] for lo, hi, _ in intervals], dtype=float)
+    cut_points = index.interpolate(positions.ravel()).reshape(-1, 2, 2)
+
+    pieces = []
+
+    # next root coordinate to copy
+    start = 0
+
+    for (lo, hi, path), (p_lo, p_hi) in zip(intervals, cut_points):
+
+        i = np.searchsorted(index.arc, lo)
+
+        if index.arc[i] == lo:
+            pieces.append(index.coords[start:i+1])
+        else:
+            pieces.append(index.coords[start:i])
+            pieces.append(p_lo[None])
+
+        pieces.append(path)
+
+        # the end of the root keeps only its last coordinate
+        if hi >= index.length:
+            start = len(index.coords) - 1
+            continue
+
+        start = np.searchsorted(index.arc, hi)
+
+        if index.arc[start] != hi:
+            pieces.append(p_hi[None])
+
+    pieces.append(index.coords[start:])
+
+    return np.concatenate([np.asarray(p, dtype=float).reshape(-1, 2) for p in pieces])
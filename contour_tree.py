@@ -0,0 +1,217 @@
+'''
+Flat array storage of an isocontour tree
+
+The nested lists from distance_transform_diff hold one geometry object per ring, and every consumer has to
+recurse over them. A ContourTree keeps the same tree in a handful of arrays, filled directly while offsetting:
+ - coords: every ring coordinate in one (N,2) buffer
+ - offsets: ring k is coords[offsets[k]:offsets[k+1]]
+ - families: the rings of node b (a contour family) are rings families[b] to families[b+1]
+ - parents: parent node of each node (-1 for the root)
+ - depth: nesting depth of each node
+
+Nodes are numbered in pre-order, so the root is node 0 and the children of a node keep the order of the branches
+'''
+
+import numpy as np
+
+from shapely.geometry import LinearRing
+
+from lazy_contours import ContourFamily
+
+
+class ContourTree:
+
+    def __init__(self, coords, offsets, families, parents, depth):
+
+        self.coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.families = np.asarray(families, dtype=np.int64)
+        self.parents = np.asarray(parents, dtype=np.int64)
+        self.depth = np.asarray(depth, dtype=np.int64)
+
+        # children of each node in order
+        self.children = [[] for _ in range(len(self.parents))]
+
+        for b, parent in enumerate(self.parents):
+            if parent >= 0:
+                self.children[parent].append(b)
+
+
+    '''
+    Build the tree from the nested lists of rings (distance_transform_diff output)
+    '''
+    @classmethod
+    def from_nested(cls, isocontours):
+
+        rings = []
+        families = [0]
+        parents = []
+        depth = []
+
+        stack = [(isocontours, -1, 0)]
+
+        while stack:
+            branch, parent, level = stack.pop()
+
+            node = len(parents)
+            parents.append(parent)
+            depth.append(level)
+
+            rings.extend(np.asarray(ring.coords, dtype=float) for ring in branch if not type(ring) is list)
+            families.append(len(rings))
+
+            # pushed in reverse so the first branch is numbered first
+            for child in [b for b in branch if type(b) is list][::-1]:
+                stack.append((child, node, level + 1))
+
+        offsets = np.concatenate([[0], np.cumsum([len(ring) for ring in rings], dtype=np.int64)])
+        coords = np.concatenate(rings) if rings else np.empty((0, 2))
+
+        return cls(coords, offsets, families, parents, depth)
+
+
+    '''
+    Build the tree of a polygon ~ the exterior followed by its isocontours, without the first boundaries rings of the root
+     - the arrays are filled while offsetting, walking the families with a stack, so no nested lists or ring objects are kept
+    '''
+    @classmethod
+    def from_polygon(cls, polygon, distance, boundaries=0):
+
+        rings = []
+        families = [0]
+        parents = []
+        depth = []
+
+        stack = [(ContourFamily(polygon, distance, boundaries), -1, 0)]
+
+        while stack:
+            family, parent, level = stack.pop()
+
+            node = len(parents)
+            parents.append(parent)
+            depth.append(level)
+
+            rings.extend(np.asarray(ring.coords, dtype=float) for ring in family)
+            families.append(len(rings))
+
+            # pushed in reverse so the first branch is numbered first
+            for branch in family.branches[::-1]:
+                stack.append((ContourFamily(branch, distance), node, level + 1))
+
+        offsets = np.concatenate([[0], np.cumsum([len(ring) for ring in rings], dtype=np.int64)])
+        coords = np.concatenate(rings) if rings else np.empty((0, 2))
+
+        return cls(coords, offsets, families, parents, depth)
+
+
+    '''
+    Number of nodes (contour families) in the tree
+    '''
+    def __len__(self):
+        return len(self.parents)
+
+
+    '''
+    Memory used by the arrays in bytes
+    '''
+    @property
+    def nbytes(self):
+        return self.coords.nbytes + self.offsets.nbytes + self.families.nbytes + self.parents.nbytes + self.depth.nbytes
+
+
+    '''
+    Get ring k as a linear ring
+    '''
+    def ring(self, k):
+        return LinearRing(self.coords[self.offsets[k]:self.offsets[k+1]])
+
+
+    '''
+    Get the contour family of node b as a list of rings
+    '''
+    def family(self, b):
+        return [self.ring(k) for k in range(self.families[b], self.families[b+1])]
+
+
+    '''
+    Iterate the nodes parent first
+    '''
+    def preorder(self, node=0):
+
+        stack = [node]
+
+        while stack:
+            b = stack.pop()
+            yield b
+            stack.extend(self.children[b][::-1])
+
+
+    '''
+    Iterate the nodes children first ~ the same order as the recursive path generation
+    '''
+    def postorder(self, node=0):
+
+        stack = [(node, False)]
+
+        while stack:
+            b, visited = stack.pop()
+
+            if visited:
+                yield b
+            else:
+                stack.append((b, True))
+                stack.extend((c, False) for c in self.children[b][::-1])
+
+
+    '''
+    Generate a path for every contour family and merge them from the leaves to the root
+     - generate: function(contour family, distance, **kwargs) that builds the path of one contour family
+     - merge: function(path, merged branches, distance) that joins the path of a node with the merged paths of its children
+    '''
+    def reduce(self, generate, merge, distance, **kwargs):
+
+        merged = {}
+
+        for b in self.postorder():
+            path = generate(self.family(b), distance, **kwargs)
+            merged[b] = merge(path, [merged.pop(c) for c in self.children[b]], distance)
+
+        return merged[0]
+
+
+    '''
+    Convert back into nested lists of rings
+    '''
+    def to_nested(self):
+
+        nested = [None] * len(self)
+
+        # children always have a larger index than their parent
+        for b in range(len(self) - 1, -1, -1):
+            nested[b] = self.family(b) + [nested[c] for c in self.children[b]]
+
+        return nested[0]
+
+
+    '''
+    Raw bytes of the arrays ~ used to hash the tree
+    '''
+    def tobytes(self):
+        return b"".join(a.tobytes() for a in (self.coords, self.offsets, self.families, self.parents))
+
+
+    '''
+    Save the arrays to a .npz file
+    '''
+    def save(self, filename):
+        np.savez_compressed(filename, coords=self.coords, offsets=self.offsets, families=self.families, parents=self.parents, depth=self.depth)
+
+
+    '''
+    Load a tree saved with save
+    '''
+    @classmethod
+    def load(cls, filename):
+
+        with np.load(filename) as data:
+            return cls(data["coords"], data["offsets"], data["families"], data["parents"], data["depth"])
@@ -0,0 +1,333 @@
+'''
+FillEngine ~ a reusable fill API that keeps its state across calls
+
+The module functions (spiral.execute, fermat_spiral.execute, convert, GcodeWriter) take their configuration as
+arguments on every call and set up their caches and worker pools again each time. A FillEngine holds the
+configuration, the result cache, the worker pool and counters for as long as it lives, so a service that fills
+thousands of jobs pays the setup once. The path generation reads its tolerances from module globals, so an engine
+only applies its settings while it generates a path (see iter_fill and SharedSettings):
+
+    with FillEngine("CFS", 2, workers=4, cache_dir="cache") as engine:
+        for filename in jobs:
+            engine.write_gcode(engine.fill_image(filename), filename + ".gcode")
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from threading import Condition
+from time import perf_counter
+
+import cv2
+
+import spiral as S
+import fermat_spiral as FS
+import connector as C
+import integer_grid as G
+
+from shapely_conversion import convert
+from optimization import optimize_polygon
+from vectors import is_vector, load_vectors
+from cache import ResultCache
+from budget import Budget
+from gcode import GcodeWriter
+
+
+'''
+Get the default tolerances and search steps of the path generation ~ in grid mode the tolerances are half a grid unit
+ - grid: grid units per pixel (None for float coordinates)
+'''
+def default_settings(grid=None):
+
+    return {
+        "point_tolerance": 0.000001 if grid is None else G.grid_tolerance(grid),
+        "search_steps": 10,
+        "intersection_tolerance": 0.000000001 if grid is None else G.grid_tolerance(grid),
+        "splice_tolerance": 0.5e-6 if grid is None else G.grid_tolerance(grid),
+        "ratio": 0.97,
+        "grid": grid,
+        "coarse": None,
+    }
+
+
+'''
+Set the tolerances and search steps of the path generation ~ also run in each worker of the pool
+'''
+def configure(settings):
+
+    S.POINT_TOLERANCE = settings["point_tolerance"]
+    S.SEARCH_STEPS = settings["search_steps"]
+    S.INTERSECTION_TOLERANCE = settings["intersection_tolerance"]
+    C.SPLICE_TOLERANCE = settings["splice_tolerance"]
+    FS.MIN_LENGTH_RATIO = settings["ratio"]
+    G.GRID_SCALE = settings["grid"]
+    S.COARSE_TOLERANCE = settings["coarse"]
+
+
+'''
+Get the current tolerances and search steps of the path generation
+'''
+def current_settings():
+
+    return {
+        "point_tolerance": S.POINT_TOLERANCE,
+        "search_steps": S.SEARCH_STEPS,
+        "intersection_tolerance": S.INTERSECTION_TOLERANCE,
+        "splice_tolerance": C.SPLICE_TOLERANCE,
+        "ratio": FS.MIN_LENGTH_RATIO,
+        "grid": G.GRID_SCALE,
+        "coarse": S.COARSE_TOLERANCE,
+    }
+
+
+'''
+Cache namespace of the settings ~ results generated with other than the default settings are not shared with them
+'''
+def settings_namespace(settings):
+    return "" if settings == default_settings() else repr(sorted(settings.items()))
+
+
+class SharedSettings:
+
+    '''
+    Applies the settings of the engines generating paths at the same time
+     - engines with the same settings generate together, an engine with other settings waits until they are done
+     - the settings before the first engine are restored when the last one is done
+    '''
+
+    def __init__(self):
+
+        self.condition = Condition()
+
+        self.settings = None
+        self.previous = None
+        self.users = 0
+
+
+    '''
+    Run the block with the settings applied ~ only the swap of the settings holds the lock, not the generation
+    '''
+    @contextmanager
+    def apply(self, settings):
+
+        with self.condition:
+
+            while self.users and self.settings != settings:
+                self.condition.wait()
+
+            if not self.users:
+                self.previous = current_settings()
+                self.settings = settings
+                configure(settings)
+
+            self.users += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+
+                self.users -= 1
+
+                if not self.users:
+                    configure(self.previous)
+                    self.condition.notify_all()
+
+
+# the settings are module globals of the path generation, shared by every engine of the process
+SETTINGS = SharedSettings()
+
+
+class FillEngine:
+
+    '''
+    method: "S", "FS" or "CFS"
+    distance: line distance
+    boundaries: number of outer isocontours to skip
+    cache_dir: directory of the result cache (None for an in-memory cache, False for no cache)
+    workers: processes of the pool that generates the branches of each polygon (None to run them in order)
+    time_budget, attempt_budget: per polygon budget of the start index retries (see Budget)
+    islands: IslandClassifier for small polygons (None to spiral every polygon)
+    regions: number of regions to split each polygon into and fill in the pool (None to fill each polygon as one tree, see regions)
+    cut_lines: cut each polygon into strips before splitting it at the branch points (not with "CFS")
+    optimize, simplify, approximation: image conversion settings (see convert)
+    ratio: shortest fermat root accepted as a fraction of the spiral length
+    search_steps: binary search steps for the reroute point of a contour
+    point_tolerance: distance error accepted when searching for a point a radius away
+    intersection_tolerance: distance at which a point is on a path when removing self intersections
+    splice_tolerance: distance at which a piece of the root passes through a splice point
+    grid: grid units per pixel for the integer grid mode (None for float coordinates, see integer_grid)
+    coarse: simplification tolerance in line distances of the coarse to fine start index search (None for the exhaustive search only)
+    scale: gcode units per path unit
+
+    The tolerances left as None take their default, which is half a grid unit in grid mode
+    '''
+
+    def __init__(self, method="CFS", distance=1, boundaries=0, cache_dir=None, workers=None, time_budget=None, attempt_budget=None,
+                 islands=None, regions=None, cut_lines=False, optimize=False, simplify=1, approximation=cv2.CHAIN_APPROX_SIMPLE,
+                 ratio=0.97, search_steps=10, point_tolerance=None, intersection_tolerance=None, splice_tolerance=None, grid=None, coarse=None, scale=0.1):
+
+        assert method in ("S", "FS", "CFS")
+        assert distance > 0
+        assert not boundaries < 0
+        assert grid is None or grid > 0
+        assert not (method == "CFS" and cut_lines)
+
+        self.method = method
+        self.distance = distance
+        self.boundaries = boundaries
+        self.islands = islands
+        self.regions = regions
+        self.cut_lines = cut_lines
+        self.optimize = optimize
+        self.simplify = simplify
+        self.approximation = approximation
+        self.scale = scale
+
+        self.grid = grid
+
+        self.settings = default_settings(grid)
+        self.settings["search_steps"] = search_steps
+        self.settings["ratio"] = ratio
+        self.settings["coarse"] = coarse
+
+        for name, value in (("point_tolerance", point_tolerance), ("intersection_tolerance", intersection_tolerance), ("splice_tolerance", splice_tolerance)):
+            if not value is None:
+                self.settings[name] = value
+
+        # results generated with other settings are not reused from a shared cache directory
+        self.cache = None if cache_dir is False else ResultCache(cache_dir, namespace=settings_namespace(self.settings))
+
+        self.time_budget = time_budget
+        self.attempt_budget = attempt_budget
+
+        # a new budget for each job (see iter_fill)
+        self.budget = None
+
+        # the workers are configured once when they start
+        self.executor = None
+
+        if not workers is None:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=configure, initargs=(self.settings,))
+
+        self.stats = {
+            "Jobs": 0,
+            "Polygons": 0,
+            "Paths": 0,
+            "Seconds": 0.0,
+        }
+
+
+    '''
+    Fallbacks recorded by the budget in the last job ~ their polygon indices are positions in that job
+    '''
+    @property
+    def fallbacks(self):
+        return [] if self.budget is None else self.budget.fallbacks
+
+
+    '''
+    Generate the paths of the polygons one at a time ~ yields each finished path
+     - the settings of the engine are applied while each path is generated and the previous ones are restored before it is
+       yielded, so generators of engines with other settings can be interleaved, and calls to the modules between the
+       paths run with their own settings
+     - engines in several threads generate together when their settings are the same and take turns otherwise ~ a module
+       function called from another thread while an engine generates a path runs with the settings of the engine
+    '''
+    def iter_fill(self, polygons):
+
+        polygons = list(polygons)
+
+        # polygons are put on the grid before the isocontours are generated from them
+        if not self.grid is None:
+            polygons = G.snap(polygons, self.grid)
+
+        self.stats["Jobs"] += 1
+        self.stats["Polygons"] += len(polygons)
+
+        if not self.time_budget is None or not self.attempt_budget is None:
+            self.budget = Budget(self.time_budget, self.attempt_budget)
+
+        if self.method == "S":
+            paths = S.iter_execute(polygons, self.distance, self.boundaries, self.cache, self.budget, islands=self.islands, executor=self.executor,
+                                   regions=self.regions, cut_lines=self.cut_lines)
+        else:
+            paths = FS.iter_execute(polygons, self.distance, self.method == "CFS", self.boundaries, self.cache, self.budget, islands=self.islands, executor=self.executor,
+                                    regions=self.regions, cut_lines=self.cut_lines)
+
+        # marks the end of the paths
+        end = object()
+
+        while True:
+
+            with SETTINGS.apply(self.settings):
+
+                start = perf_counter()
+
+                try:
+                    path = next(paths, end)
+                finally:
+                    self.stats["Seconds"] += perf_counter() - start
+
+            if path is end:
+                return
+
+            self.stats["Paths"] += 1
+            yield path
+
+
+    '''
+    Generate the paths of the polygons
+    '''
+    def fill(self, polygons):
+        return list(self.iter_fill(polygons))
+
+
+    '''
+    Load an image or a vector file as polygons with the conversion settings of the engine
+    '''
+    def load(self, filename):
+
+        if is_vector(filename):
+            polygons = load_vectors(filename)
+
+            if self.optimize:
+                polygons = [optimize_polygon(polygon) for polygon in polygons]
+
+            return polygons
+
+        image = cv2.imread(filename, 0)
+        assert not image is None
+
+        return convert(image, approximation=self.approximation, optimize=self.optimize, simplify=self.simplify)
+
+
+    '''
+    Generate the paths of an image or vector file
+    '''
+    def fill_image(self, filename):
+        return self.fill(self.load(filename))
+
+
+    '''
+    Write paths to a gcode file with the scale of the engine
+    '''
+    def write_gcode(self, total_path, filename):
+        GcodeWriter(filename=filename, scale=self.scale).convert(total_path)
+
+
+    '''
+    Shut down the worker pool
+    '''
+    def close(self):
+
+        if not self.executor is None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
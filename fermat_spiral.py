@@ -7,9 +7,27 @@ Methods for generating fermat spirals from input spirals
 import spiral as S
 from spiral import calculate_point, calculate_point_contour
 
+import shapely
 from shapely.geometry import Point, LineString
 
-from shapely_utilities import cut, distance_transform_diff
+from shapely_utilities import cut, distance_transform_diff, self_intersections_binary
+from shapely_utilities import coords_array, concatenate, path_length
+
+import numpy as np
+
+from cache import normalize, translate_paths
+from branches import generate_tree, merge_separate
+from contour_tree import ContourTree
+from lazy_contours import reduce_lazy
+from regions import fill_decomposed
+from connector import RootIndex, splice_intervals, resolve_conflicts, assemble
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+
+# shortest fermat root accepted, as a fraction of the length of its spiral
+MIN_LENGTH_RATIO = 0.97
 
 
 '''
@@ -43,6 +61,7 @@ def outer_spiral(path, distance):
     # start at the first point in the contour
     start = Point(path.coords[0])
     
+    # pieces of the spiral, joined into one array when it is returned
     spiral = []
     outer_pieces = []
 
@@ -51,7 +70,7 @@ def outer_spiral(path, distance):
         end = calculate_break(path, start, distance)
         # return if the end point is the end of the path
         if end is None or path.project(end) == path.length:   
-            return spiral+list(path.coords), outer_pieces, True
+            return concatenate(spiral + [coords_array(path)]), outer_pieces, True
         
 
         # get the reroute point away from the end towards start
@@ -60,9 +79,9 @@ def outer_spiral(path, distance):
 
         # if there is no reroute point, we will return the spiral from start to calculated end ~ too small to make fermat
         if reroute is None:
-            ls,_ = cut(LineString(path), LineString(path).project(end))
+            ls,_ = cut(path, path.project(end))
 
-            return spiral+list(ls.coords), [], True
+            return concatenate(spiral + [coords_array(ls)]), [], True
 
 
         p1,center = cut(path, path.project(reroute))
@@ -75,11 +94,11 @@ def outer_spiral(path, distance):
         start = calculate_break(p2, reroute, distance)
 
         # add these coordinates to the spirals
-        spiral.extend(list(p1.coords))
+        spiral.append(coords_array(p1))
 
         # if the length of the remaining path is where the next jump would be, break the loop
         if start is None or p2.project(start) == p2.length:
-            return spiral + list(p2.coords)[::-1], outer_pieces, True
+            return concatenate(spiral + [coords_array(p2)[::-1]]), outer_pieces, True
         
         # cut the inner contour at this point
         outer, inner = cut(p2, p2.project(start))
@@ -94,6 +113,8 @@ def outer_spiral(path, distance):
 Build the inner spiral of the fermat spiral using the pieces of the spiral
 '''
 def inner_spiral(outer_pieces, distance, center, path):    
+
+    # pieces of the inner spiral, joined into one array at the end
     spiral = []
     if not outer_pieces:
         pass
@@ -122,12 +143,15 @@ def inner_spiral(outer_pieces, distance, center, path):
                 # self intersections possible ~ need to check somehow.... seems like it works ok-ish???           
                 test_path = LineString(contour.coords[:-1])
                 generated_path = LineString([contour.coords[-1], path[-1]])
-                            
+
+                # a single query ~ the prepared predicate skips the intersection when they do not meet
+                shapely.prepare(test_path)
+
                 if test_path.intersects(generated_path):
                     int_point = test_path.intersection(generated_path)
-                    
-                    if int_point.type == "MultiPoint":
-                        end = sorted(list(int_point), key=end.distance)[-1]
+
+                    if int_point.geom_type == "MultiPoint":
+                        end = sorted(list(int_point.geoms), key=end.distance)[-1]
                     else:
                         end = int_point
                         
@@ -156,17 +180,19 @@ def inner_spiral(outer_pieces, distance, center, path):
             ls = LineString(path)
             ls, _ = cut(ls, ls.project(Point(contour.coords[-1])))
             
-            path = list(ls.coords)
+            path = coords_array(ls)
             
             # self intersections possible ~ need to check somehow.... seems like it works ok-ish???           
             test_path = LineString(path[:-1])
             generated_path = LineString([contour.coords[-1], path[-1]])
-            
+
+            shapely.prepare(test_path)
+
             if test_path.intersects(generated_path):
                 int_point = test_path.intersection(generated_path)
-                
-                if int_point.type == "MultiPoint":
-                    end = sorted(list(int_point), key=end.distance)[0]
+
+                if int_point.geom_type == "MultiPoint":
+                    end = sorted(list(int_point.geoms), key=end.distance)[0]
                 else:
                     end = int_point
                     
@@ -195,17 +221,19 @@ def inner_spiral(outer_pieces, distance, center, path):
             
             # if the projection is the start point, do not cut
             if dis == 0:
-                spiral.extend(list(c0.coords)[::-1])
+                spiral.append(coords_array(c0)[::-1])
             else:
                 _, inner = cut(c0,  dis)
-                spiral.extend(list(inner.coords)[::-1])
+                spiral.append(coords_array(inner)[::-1])
                 
         
         # add the last piece
-        spiral.extend(list(formatted_pieces[-1].coords)[::-1])
+        spiral.append(coords_array(formatted_pieces[-1])[::-1])
+
+    spiral = concatenate(spiral)
     
     # return path + spiral[::-1]
-    return S.remove_intersections(path) + S.remove_intersections(spiral[::-1])[::-1]
+    return concatenate([S.remove_intersections(path), S.remove_intersections(spiral[::-1])[::-1]])
 
 
 '''
@@ -213,8 +241,8 @@ Convert a spiral path into a fermat path
 '''
 def convert_fermat(path,distance, debug=False):
     
-    if path is None or not path:
-        return []
+    if path is None or len(path) == 0:
+        return concatenate([])
     
     path, pieces, center = outer_spiral(path, distance)
 
@@ -227,223 +255,406 @@ def convert_fermat(path,distance, debug=False):
 Connect root and branch fermat spirals
 '''
 def combine_paths(root, branches, dis):
-        
-    root_ls = LineString(root)
-        
-    # find the start and end points of the root
-    for b in branches:
-
-        if not b:
-            continue
-        
-        start = b[0]
-        end = b[-1]
-        
-        # project end onto the root
-        end_cut_dis = root_ls.project(Point(end))
-        
-        point = root_ls.interpolate(end_cut_dis)
 
-        int_buff = point.buffer(dis)
+    branches = [b for b in branches if len(b)]
 
-        # get the line within the buffer distance of the point
-        possible_line = int_buff.intersection(root_ls)
+    if not branches:
+        return coords_array(LineString(root))
 
-        start_pt = None
-        
-        if possible_line.type == "LineString":
-            start_pt = possible_line.interpolate(possible_line.project(Point(start)))
-        else:
-            for item in possible_line:
+    # find the interval of the root each branch replaces, and join the ones that do not overlap in one pass
+    index = RootIndex(root)
+    intervals, conflicts = resolve_conflicts(splice_intervals(index, branches, dis))
 
-                if item.type == "LineString":
-                    # need to use this check instead of intersects because intersects will return false for some reason
-                    test = item.interpolate(item.project(point))
+    root_ls = LineString(assemble(index, intervals))
 
-                    if test.almost_equals(point):
-                        start_pt = item.interpolate(item.project(Point(start)))
-                        break
+    # overlapping branches are spliced one at a time into the joined path
+    for i in conflicts:
+        root_ls = splice_branch(root_ls, branches[i], dis)
 
-        start_cut_dis = root_ls.project(start_pt)        
+    return coords_array(root_ls)
 
-        # if the start is 0 
-        if start_cut_dis == 0:
 
-            # shift the end point away from the start
-            new_end = calculate_point(root_ls, 0, dis, True)
+'''
+Splice a single branch into the root linestring ~ returns the new root linestring
+ - the joined root is indexed again for every branch, since each splice moves the positions after it
+'''
+def splice_branch(root_ls, b, dis):
 
-            _,l2 = cut(root_ls, root_ls.project(new_end))
-            new_list = [root_ls.coords[0]] + b + list(l2.coords)
+    index = RootIndex(coords_array(root_ls))
 
-        # if the end is at the start
-        elif end_cut_dis == 0:
+    interval = splice_intervals(index, [b], dis)[0]
 
-            new_end = calculate_point(root_ls, 0, dis, True)
+    # the end of the branch is not near the root
+    if interval is None:
+        return root_ls
 
-            _,l2 = cut(root_ls, root_ls.project(new_end))
-            new_list = [root_ls.coords[0]] + b[::-1] + list(l2.coords)
-        
-        # if the start is at the end
-        elif start_cut_dis == root_ls.length:
+    return LineString(assemble(index, [interval]))
 
-            new_end = calculate_point(root_ls, root_ls.length, dis, False)
 
-            l1,_ = cut(root_ls, root_ls.project(new_end))
-            new_list = list(l1.coords) + b[::-1] + [root_ls.coords[-1]]
 
-        # if the end is at the end
-        elif end_cut_dis == root_ls.length:
+'''
+Convert a spiral path into a fermat root ~ returns None if the root is not simple or loses too much length
+'''
+def accept_root(s_path, distance):
 
-            new_end = calculate_point(root_ls, root_ls.length, dis, False)
+    if len(s_path) < 2:
+        return None
 
-            l1,_ = cut(root_ls, root_ls.project(new_end))
-            new_list =  list(l1.coords) + b + [root_ls.coords[-1]]       
+    root = convert_fermat(s_path, distance)
 
-        elif start_cut_dis < end_cut_dis:
-            l1,_ = cut(root_ls, start_cut_dis)
-            _,l2 = cut(root_ls, end_cut_dis)
-            
-            new_list = list(l1.coords) + b + list(l2.coords)
-        else:
-            l1,_ = cut(root_ls, end_cut_dis)
-            _,l2 = cut(root_ls, start_cut_dis)
-            
-            new_list =  list(l1.coords) + b[::-1] + list(l2.coords)       
-        
-        root_ls = LineString(new_list)
-        
-    return list(root_ls.coords)
+    if path_length(root) / path_length(s_path) > MIN_LENGTH_RATIO and LineString(root).is_simple:
+        return root
 
+    return None
 
 
 '''
-Generate unconnected fermat path
+Generate the fermat root of a contour family ~ retry the spiral start index until the fermat path is simple and keeps its length
 '''
-def generate_total_path(isocontours, distance):
-    
-    total_path = []
-    contour_family = []
-    
-    # loop through each value in the result
-    for branch in isocontours:
-        if type(branch) is list:  
-            total_path.extend(generate_total_path(branch, distance))
-        else:
-            contour_family.append(branch)
+def generate_root(contour_family, distance, spirals=None, budget=None):
+
+    # best invalid attempt so far ~ ((intersection count, -ratio), root)
+    best = None
 
     i=0
-    done = False
-    while not done:
-        s_path = S.generate_path(contour_family, distance,start_index=i) 
+    while True:
+        s_path = S.generate_path(contour_family, distance,start_index=i, spirals=spirals, budget=budget, coarse=False)
+
+        if len(s_path) == 0:
+            return concatenate([]) if best is None else best[1]
 
-        if not s_path:
-            root = []
-            break
         root = convert_fermat(s_path,distance)
 
         i+=1
-        ratio = (LineString(root).length / LineString(s_path).length)
-        done = ratio > 0.97 and LineString(root).is_simple
+        ratio = path_length(root) / path_length(s_path)
 
-        if not done:
-            print(i, " - FS", ratio)
+        if ratio > MIN_LENGTH_RATIO and LineString(root).is_simple:
+            return root
 
-    total_path.append(root)
+        print(i, " - FS", ratio)
+
+        # coarse to fine ~ after the first attempt fails the fermat checks also run on simplified rings, and the retries below are the fallback
+        if i == 1 and not S.COARSE_TOLERANCE is None and spirals is None:
+            refined = S.refine_path(contour_family, distance, accept_root)
+
+            if not refined is None:
+                return refined
+
+        # keep the attempt with the fewest self intersections (then the best length ratio), and return it when the budget runs out
+        if not budget is None:
+
+            score = (len(self_intersections_binary(LineString(root))) if len(root) > 1 else 0, -ratio)
+
+            if best is None or score < best[0]:
+                best = (score, root)
+
+            if budget.exhausted(i, len(next(iter(contour_family)).coords)):
+                budget.fall_back("FS", i, best[0][0], -best[0][1])
+                return best[1]
+
+        # every start point was tried
+        if i >= len(next(iter(contour_family)).coords):
+            return root if best is None else best[1]
 
-    return total_path
 
 '''
-Generate connected fermat path
+Generate unconnected fermat path
+ - isocontours: nested lists (recursive, each branch is cached) or a ContourTree (iterative, only the whole tree is cached)
+ - executor: worker pool to generate the branches of the tree in parallel
 '''
-def generate_total_path_connected(isocontours, distance):
-    
-    branches = []
+def generate_total_path(isocontours, distance, cache=None, spirals=None, budget=None, executor=None):
+
+    if not cache is None:
+        key = cache.key(isocontours, distance, "FS")
+        total_path = cache.get(key)
 
-    contour_family = []
+        if not total_path is None:
+            return total_path
 
-    # loop through each node or branch in the tree
-    for node in isocontours:
+    # fallbacks are not cached, a later run with a larger budget may find a valid path
+    fallbacks = 0 if budget is None else len(budget.fallbacks)
+
+    if not executor is None:
+        total_path = generate_tree(isocontours, distance, executor, generate_root, merge_separate, budget, cache, "FS")
+    elif isinstance(isocontours, ContourTree):
+        total_path = isocontours.reduce(generate_root, merge_separate, distance, spirals=spirals, budget=budget)
+    else:
+        total_path = []
+        contour_family = []
         
-        # if the result node is a branch, recursively call this function on it
-        if type(node) is list:
-            branches.append(generate_total_path_connected(node, distance))
-        # if the result node is not a branch, add it to the contour family
-        else:
-            contour_family.append(node)
-    
-    i=0
-    done = False
-    while not done:
-        s_path = S.generate_path(contour_family, distance,start_index=i)    
+        # loop through each value in the result
+        for branch in isocontours:
+            if type(branch) is list:  
+                total_path.extend(generate_total_path(branch, distance, cache, spirals, budget))
+            else:
+                contour_family.append(branch)
 
+        total_path.append(generate_root(contour_family, distance, spirals, budget))
 
-        if not s_path:
-            root = []
-            break
-        root = convert_fermat(s_path,distance)
+    if not cache is None and (budget is None or len(budget.fallbacks) == fallbacks):
+        cache.put(key, total_path)
 
-        i+=1
-        ratio = (LineString(root).length / LineString(s_path).length)
-        done = ratio > 0.97 and LineString(root).is_simple
+    return total_path
 
-        if not done:
-            print(i, " - FS", ratio)
-    
-        # combine the root and the branches if the root exists
+'''
+Join the connected paths of the branches to the root of their contour family
+'''
+def merge_connected(root, branches, distance):
 
-        else:
-            if root:
+    # combine the root and the branches if the root exists
+    if len(root):
 
-                path = combine_paths(root, branches, distance)
-                return path
+        # branches without a root of their own are lists of paths, these are kept as separate paths
+        paths = [b for b in branches if not type(b) is list]
+        others = [b for b in branches if type(b) is list and b]
+
+        path = combine_paths(root, paths, distance)
+
+        if others:
+            path = [path] + others
+    else:
+        path = branches
+
+    return path
+
+
+'''
+Generate connected fermat path
+ - isocontours: nested lists (recursive, each branch is cached) or a ContourTree (iterative, only the whole tree is cached)
+ - executor: worker pool to generate the branches of the tree in parallel
+'''
+def generate_total_path_connected(isocontours, distance, cache=None, spirals=None, budget=None, executor=None):
+
+    if not cache is None:
+        key = cache.key(isocontours, distance, "CFS")
+        path = cache.get(key)
+
+        if not path is None:
+            return path
+
+    # fallbacks are not cached, a later run with a larger budget may find a valid path
+    fallbacks = 0 if budget is None else len(budget.fallbacks)
+
+    if not executor is None:
+        path = generate_tree(isocontours, distance, executor, generate_root, merge_connected, budget, cache, "CFS")
+    elif isinstance(isocontours, ContourTree):
+        path = isocontours.reduce(generate_root, merge_connected, distance, spirals=spirals, budget=budget)
+    else:
+        branches = []
+
+        contour_family = []
+
+        # loop through each node or branch in the tree
+        for node in isocontours:
+            
+            # if the result node is a branch, recursively call this function on it
+            if type(node) is list:
+                branches.append(generate_total_path_connected(node, distance, cache, spirals, budget))
+            # if the result node is not a branch, add it to the contour family
             else:
-                return branches
+                contour_family.append(node)
+        
+        root = generate_root(contour_family, distance, spirals, budget)
+
+        path = merge_connected(root, branches, distance)
 
+    if not cache is None and (budget is None or len(budget.fallbacks) == fallbacks):
+        cache.put(key, path)
 
+    return path
 
+
+
+'''
+Flatten the nested output of the connected path into a list of paths
+ - the points left over at each level of the nesting are joined into one path at the end of that level
+'''
 def clean_connected(path):
     
     total_path = []
-    rest = []
-    
-    for p in path:
 
-        if not p:
-            continue
+    # each level keeps its remaining items and its left over points ~ walked with a stack instead of recursion
+    stack = [(iter(path), [])]
+
+    while stack:
+
+        items, rest = stack[-1]
+
+        for p in items:
 
-        if type(p) == list:
-            if type(p[0]) == tuple:
+            if len(p) == 0:
+                continue
+
+            # lists are branches, 2D arrays are paths
+            if type(p) == list:
+                stack.append((iter(p), []))
+                break
+            elif np.ndim(p) == 2:
                 total_path.append(p)
             else:
-                total_path.extend(clean_connected(p))
+                rest.append(p)
+
+        # the level is finished once its items run out
         else:
-            rest.append(p)
-                
-    total_path.append(rest)
+            stack.pop()
+            total_path.append(concatenate(rest))
+
     return total_path
-                
 
 
-def execute(polygons, distance, connected=False, boundaries=0):
-    
+
+'''
+Generate the paths one polygon at a time ~ yields each finished path
+ - only the isocontours and paths of the current polygon are held in memory
+ - the yielded paths are the same as the list returned by execute
+ - workers: number of processes to generate the branches of each polygon in parallel (None to run them in order)
+ - executor: an open worker pool to use instead of starting one for the call
+ - islands: IslandClassifier that sends small polygons to a cheap fill
+ - regions: number of regions to split each polygon into before its isocontours exist, filled in the pool (see regions)
+ - cut_lines: cut each polygon into strips with straight lines before splitting it at the branch points (not with connected)
+'''
+def iter_execute(polygons, distance, connected=False, boundaries=0, cache=None, budget=None, workers=None, islands=None, executor=None, regions=None, cut_lines=False):
+
     assert not boundaries < 0
 
+    # the paths of the strips can not be spliced into one connected path (see regions)
+    assert not (connected and cut_lines)
 
-    total_path = []
+    rest = []
 
-    for polygon in polygons:
-        isocontours = [polygon.exterior] + distance_transform_diff(polygon, distance)
+    # sibling branches of each tree run in parallel in the pool ~ a pool that is passed in is reused and left open
+    if executor is None and not workers is None:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        pool = nullcontext(executor)
 
-        if connected:
-            if isocontours:
-                total_path.append(generate_total_path_connected(isocontours[boundaries:], distance))
-        else:
-            if isocontours:
-                total_path.extend(generate_total_path(isocontours[boundaries:], distance))
+    with pool as executor:
+
+        for i, polygon in enumerate(polygons):
+
+            if not budget is None:
+                budget.start(i)
+
+            # small islands and slivers get a cheap fill instead of the path generation
+            if not islands is None:
+                paths = islands.fill(polygon, distance)
+
+                if not paths is None:
+                    yield from paths
+                    continue
 
+            # identical shapes at different positions share the cached results
+            if not cache is None:
+                polygon, offset = normalize(polygon)
+
+            # the cache and the pool need the whole tree, otherwise the isocontours are generated while the path is built
+            if not regions is None or (cache is None and executor is None):
+                isocontours = None
+            elif cache is None:
+                isocontours = ContourTree.from_polygon(polygon, distance, boundaries)
+            else:
+                # nested lists so each branch is cached too
+                isocontours = ([polygon.exterior] + cache.isocontours(polygon, distance))[boundaries:]
+
+            # the regions generate their own isocontours in the pool ~ the cache keeps the paths of the whole polygon
+            if not regions is None:
+                paths = fill_decomposed(polygon, distance, regions, generate_root, merge_connected if connected else merge_separate, boundaries, cut_lines, executor,
+                                        budget, cache, "CFS" if connected else "FS")
+
+                # strips cut apart are separate paths ~ a polygon that is not cut has one top node
+                if not connected:
+                    path = [p for result in paths for p in result]
+                else:
+                    path = paths[0]
+            elif isocontours is None:
+                path = reduce_lazy(polygon, distance, generate_root, merge_connected if connected else merge_separate, boundaries, budget=budget)
+            elif connected:
+                path = generate_total_path_connected(isocontours, distance, cache, budget=budget, executor=executor)
+            else:
+                path = generate_total_path(isocontours, distance, cache, budget=budget, executor=executor)
+
+            if not cache is None:
+                path = translate_paths(path, offset)
+
+            if not connected:
+                yield from path
+
+            # clean the connected output of this polygon (same as clean_connected on the whole list)
+            elif len(path) == 0:
+                continue
+            elif type(path) == list:
+                yield from clean_connected(path)
+            elif np.ndim(path) == 2:
+                yield path
+            else:
+                rest.append(path)
 
-    # need to clean output of connected path
     if connected:
-        total_path = clean_connected(total_path)
+        yield concatenate(rest)
 
-    return total_path
+
+'''
+Generate the fermat (or connected fermat) fill
+'''
+def execute(polygons, distance, connected=False, boundaries=0, cache=None, budget=None, workers=None, islands=None, regions=None, cut_lines=False):
+    return list(iter_execute(polygons, distance, connected, boundaries, cache, budget, workers, islands, regions=regions, cut_lines=cut_lines))
+
+
+
+'''
+Generate the spiral, fermat and connected fermat paths in one pass
+ - the isocontours of each polygon are computed once
+ - the spiral attempts of each contour family are shared by the three path types
+ - returns a dictionary of total paths keyed by path type ("S", "FS", "CFS")
+'''
+def execute_all(polygons, distance, boundaries=0, cache=None, budget=None, islands=None):
+
+    assert not boundaries < 0
+
+    results = {"S": [], "FS": [], "CFS": []}
+
+    for i, polygon in enumerate(polygons):
+
+        if not budget is None:
+            budget.start(i)
+
+        # the cheap fill of a small island is the same for every path type
+        if not islands is None:
+            paths = islands.fill(polygon, distance)
+
+            if not paths is None:
+                results["S"].extend(paths)
+                results["FS"].extend(paths)
+                results["CFS"].append(paths)
+                continue
+
+        if cache is None:
+            isocontours = [polygon.exterior] + distance_transform_diff(polygon, distance)
+        else:
+            polygon, offset = normalize(polygon)
+            isocontours = [polygon.exterior] + cache.isocontours(polygon, distance)
+
+        isocontours = isocontours[boundaries:]
+
+        # spiral attempts of each contour family, shared by the three path types
+        spirals = {}
+
+        paths = {
+            "S": S.generate_total_path(isocontours, distance, cache, spirals, budget),
+            "FS": generate_total_path(isocontours, distance, cache, spirals, budget),
+            "CFS": generate_total_path_connected(isocontours, distance, cache, spirals, budget),
+        }
+
+        for path_type, path in paths.items():
+
+            if not cache is None:
+                path = translate_paths(path, offset)
+
+            if path_type == "CFS":
+                results[path_type].append(path)
+            else:
+                results[path_type].extend(path)
+
+    results["CFS"] = clean_connected(results["CFS"])
+
+    return results
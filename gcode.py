@@ -86,6 +86,27 @@ class GcodeWriter:
         return output
 
 
+    '''
+    Build the commands to trace a single path
+    '''
+    def command_path(self, path):
+
+        # move to p0
+        output = self.command_rapid(path[0])
+        
+        # pen down
+        output += self.command_down()
+
+        # trace the path
+        for p1 in path[1:]:
+            output += self.command_move(p1)
+            
+        # pen up
+        output += self.command_up()
+
+        return output
+
+
     '''
     Convert the total path into 
     '''
@@ -96,22 +117,8 @@ class GcodeWriter:
         # loop through each path
         for path in total_path:
             
-            if path:
-
-                # move to p0
-                output += self.command_rapid(path[0])
-                
-                # pen down
-                output += self.command_down()
-                
-                p0 = path[0]
-
-                # trace the path
-                for p1 in path[1:]:
-                    output += self.command_move(p1)
-                    
-                # pen up
-                output += self.command_up()
+            if len(path):
+                output += self.command_path(path)
             
         # home machine
         output += "G28;\n"
@@ -126,6 +133,67 @@ class GcodeWriter:
         return output
 
 
+    '''
+    Write the total path to the file while it is generated ~ yields each path after it is written
+     - total_path can be a generator (like iter_execute), so the paths can be passed on to the metrics without holding them all
+     - the file matches the output of convert
+    '''
+    def stream(self, total_path):
+
+        assert not self.filename is None
+
+        with open(self.filename, "w") as f:
+
+            f.write(self.header())
+
+            for path in total_path:
+
+                if len(path):
+                    f.write(self.command_path(path))
+
+                yield path
+
+            # home machine
+            f.write("G28;\n")
+
+
+    '''
+    Build the printing commands of one layer ~ every path is traced at the layer height with the extruder primed, then retracted and lifted
+    '''
+    def command_layer(self, total_path, current_layer):
+
+        output = ""
+
+        for path in total_path:
+
+            if len(path) == 0:
+                continue
+
+            # move to p0
+            output += self.command_rapid(path[0])
+
+            # undo retraction
+            output += "G1 E1.40000 F2100.00000;\n"
+
+            # pen down
+            output += "G01 Z" + str(current_layer) + ";\n"
+
+            p0 = path[0]
+
+            # trace the path
+            for p1 in path[1:]:
+                output += self.command_print(p0, p1)
+                p0 = p1
+
+            # retraction
+            output += "G1 E-1.40000 F2100.00000;\n"
+
+            # pen up
+            output += "G01 Z" + str(current_layer + 0.2) + ";\n"
+
+        return output
+
+
     '''
     Convert the path into printable code
     '''
@@ -140,31 +208,8 @@ class GcodeWriter:
         output += "G1 F1200.000;\n"
 
         while current_layer < height:
-            for path in total_path:
-                
-                
-                # move to p0
-                output += self.command_rapid(path[0])
-                
-                # undo retraction
-                output += "G1 E1.40000 F2100.00000;\n"
+            output += self.command_layer(total_path, current_layer)
 
-                # pen down
-                output += "G01 Z" + str(current_layer) + ";\n"
-                
-                p0 = path[0]
-
-                # trace the path
-                for p1 in path[1:]:
-                    output += self.command_print(p0, p1)
-                    p0 = p1
-                    
-                # retraction
-                output += "G1 E-1.40000 F2100.00000;\n"
-
-                # pen up
-                output += "G01 Z" + str(current_layer + 0.2) + ";\n"
-            
             current_layer += layer
             output += "G01 Z" + str(current_layer + 0.2) + ";\n"
 
@@ -183,6 +228,32 @@ class GcodeWriter:
 
 
 
+    '''
+    Convert a different total path per layer into printable code
+     - layers: iterable of total paths, one per layer (this can be a generator, each layer is written as it arrives)
+     - layer: height of each layer
+    '''
+    def convert_layers(self, layers, layer=0.2):
+
+        assert not self.filename is None
+
+        with open(self.filename, "w") as f:
+
+            f.write(self.header())
+            f.write("G1 F1200.000;\n")
+
+            for i, total_path in enumerate(layers):
+
+                current_layer = layer * (i+1)
+
+                f.write(";LAYER:" + str(i) + "\n")
+                f.write(self.command_layer(total_path, current_layer))
+
+            # home machine
+            f.write("G28 X Y;\n")
+
+
+
     '''
     Convert the path into printable code
     '''
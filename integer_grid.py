@@ -0,0 +1,142 @@
+'''
+Integer grid coordinate mode
+
+The isocontours are float offsets, so whether a ring touches, splits or vanishes depends on rounding inside
+GEOS, and the searches that follow need float tolerances to decide when two points are the same (the point
+search and the self intersection removal of spiral, the splice check of connector). Those decisions are where
+the retries and the loops that do not converge come from, and they can change between machines
+
+In grid mode the polygons are snapped to a grid of GRID_SCALE units per pixel, and every isocontour step is done
+in int64 grid coordinates with Clipper's integer offsetting and clipping (pyclipper), which is exact. The rings
+are then the same on every machine, and the tolerances become half a grid unit ~ points closer than that are the
+same grid point
+
+pyclipper is optional ~ without it the step uses the fixed precision overlay of GEOS (grid_size), which also
+snaps every vertex of the result to the grid
+'''
+
+import numpy as np
+
+import shapely
+from shapely.geometry import Polygon, MultiPolygon, CAP_STYLE, JOIN_STYLE
+
+try:
+    import pyclipper
+except ImportError:
+    pyclipper = None
+
+
+# grid units per pixel ~ None for float coordinates (set through engine.configure)
+GRID_SCALE = None
+
+# longest mitre accepted, in offset distances ~ the GEOS buffer default
+MITRE_LIMIT = 5.0
+
+
+'''
+Scale float coordinates to int64 grid coordinates
+'''
+def to_grid(coords, scale):
+    return np.rint(np.asarray(coords, dtype=float) * scale).astype(np.int64)
+
+
+'''
+Scale grid coordinates back to float coordinates
+'''
+def from_grid(points, scale):
+    return np.asarray(points, dtype=float).reshape(-1, 2) / scale
+
+
+'''
+Distance below which two points are the same grid point
+'''
+def grid_tolerance(scale):
+    return 0.5 / scale
+
+
+'''
+Snap polygons to the grid ~ polygons that collapse to nothing are dropped
+'''
+def snap(polygons, scale):
+
+    if not polygons:
+        return []
+
+    snapped = shapely.get_parts(shapely.set_precision(np.asarray(polygons, dtype=object), 1 / scale))
+
+    return [p for p in snapped if p.geom_type == "Polygon" and not p.is_empty]
+
+
+'''
+Grid path of a ring with the orientation Clipper treats as an outer ring (or a hole if outer is False)
+'''
+def ring_path(ring, scale, outer=True):
+
+    path = to_grid(ring.coords[:-1], scale).tolist()
+
+    if pyclipper.Orientation(path) != outer:
+        path.reverse()
+
+    return path
+
+
+'''
+Polygons of a Clipper poly tree in float coordinates ~ islands inside holes are added as polygons of their own
+'''
+def tree_polygons(tree, scale):
+
+    polygons = []
+
+    queue = list(tree.Childs)
+
+    while queue:
+        node = queue.pop(0)
+
+        holes = [from_grid(hole.Contour, scale) for hole in node.Childs]
+        polygons.append(Polygon(from_grid(node.Contour, scale), holes))
+
+        for hole in node.Childs:
+            queue.extend(hole.Childs)
+
+    return polygons
+
+
+'''
+Shrink the exterior of a polygon by the distance without changing the holes ~ the grid version of one distance_transform_diff step
+ - returns an empty Polygon, a Polygon or a MultiPolygon like the float step
+'''
+def inset_exterior(polygon, distance, scale):
+
+    if pyclipper is None:
+        temp = polygon.exterior.buffer(distance, cap_style = CAP_STYLE.flat, join_style = JOIN_STYLE.mitre)
+        return polygon.difference(temp, grid_size=1 / scale)
+
+    offset = pyclipper.PyclipperOffset()
+    offset.MiterLimit = MITRE_LIMIT
+    offset.AddPath(ring_path(polygon.exterior, scale), pyclipper.JT_MITER, pyclipper.ET_CLOSEDPOLYGON)
+
+    inner = offset.Execute(-distance * scale)
+
+    if not inner:
+        return Polygon()
+
+    # the holes are cut out of the shrunk exterior
+    clipper = pyclipper.Pyclipper()
+    clipper.AddPaths(inner, pyclipper.PT_SUBJECT, True)
+
+    holes = [ring_path(ring, scale) for ring in polygon.interiors]
+
+    if holes:
+        clipper.AddPaths(holes, pyclipper.PT_CLIP, True)
+
+    tree = clipper.Execute2(pyclipper.CT_DIFFERENCE, pyclipper.PFT_NONZERO, pyclipper.PFT_NONZERO)
+
+    polygons = tree_polygons(tree, scale)
+
+    if not polygons:
+        return Polygon()
+
+    if len(polygons) == 1:
+        return polygons[0]
+
+    return MultiPolygon(polygons)
@@ -0,0 +1,158 @@
+'''
+Cheap fills for small islands
+
+Tiny polygons and thin slivers go through the offsetting, the start index retries and the fermat conversion
+like any other shape, and often fail anyway. The classifier sends them straight to a cheap fill instead:
+ - contour: one pass around each ring of the polygon
+ - zigzag: parallel lines along the long axis of the polygon, joined end to end
+'''
+
+import numpy as np
+
+from shapely.geometry import Polygon, LineString
+from shapely.ops import polylabel
+
+from shapely_utilities import coords_array
+
+
+class IslandClassifier:
+
+    '''
+    Thresholds are in units of the line distance (areas in distance squared):
+    min_area: polygons smaller than this get a single contour pass
+    min_perimeter: polygons with a shorter exterior get a single contour pass
+    contour_radius: polygons whose inscribed circle is smaller than this get a single contour pass
+    zigzag_radius: polygons whose inscribed circle is smaller than this get a zigzag (if they have no holes)
+    max_rings: polygons with more rings than this (exterior and holes) are never zigzagged
+
+    counts: number of polygons sent to each strategy ("spiral" is the full path generation)
+    '''
+
+    def __init__(self, min_area=1, min_perimeter=4, contour_radius=1, zigzag_radius=2, max_rings=1):
+
+        assert contour_radius <= zigzag_radius
+
+        self.min_area = min_area
+        self.min_perimeter = min_perimeter
+        self.contour_radius = contour_radius
+        self.zigzag_radius = zigzag_radius
+        self.max_rings = max_rings
+
+        self.counts = {"spiral": 0, "contour": 0, "zigzag": 0}
+
+
+    '''
+    Get the fill strategy of a polygon ~ "spiral", "contour" or "zigzag"
+     - the area and perimeter are checked first, the inscribed circle is only computed if they pass
+    '''
+    def classify(self, polygon, distance):
+
+        if polygon.area < self.min_area * distance**2 or polygon.exterior.length < self.min_perimeter * distance:
+            return "contour"
+
+        # the inscribed circle only needs to be accurate to a fraction of the line
+        center = polylabel(polygon, distance / 10)
+        radius = polygon.exterior.distance(center)
+
+        for interior in polygon.interiors:
+            radius = min(radius, interior.distance(center))
+
+        if radius < self.contour_radius * distance:
+            return "contour"
+
+        if radius < self.zigzag_radius * distance and len(polygon.interiors) + 1 <= self.max_rings:
+            return "zigzag"
+
+        return "spiral"
+
+
+    '''
+    Classify a polygon and count it ~ returns the cheap fill paths, or None if it needs the full path generation
+    '''
+    def fill(self, polygon, distance):
+
+        strategy = self.classify(polygon, distance)
+
+        self.counts[strategy] += 1
+
+        if strategy == "contour":
+            return contour_fill(polygon)
+        elif strategy == "zigzag":
+            return zigzag_fill(polygon, distance)
+
+        return None
+
+
+'''
+Fill a polygon with one pass around each of its rings
+'''
+def contour_fill(polygon):
+    return [coords_array(polygon.exterior)] + [coords_array(interior) for interior in polygon.interiors]
+
+
+'''
+Fill a polygon with lines along its long axis spaced by the distance, joined end to end
+ - a line that is split by a concave part ends the zigzag, and its pieces become separate paths
+'''
+def zigzag_fill(polygon, distance):
+
+    # direction of the long side of the minimum rotated rectangle
+    corners = np.asarray(polygon.minimum_rotated_rectangle.exterior.coords)
+    sides = np.diff(corners[:3], axis=0)
+    axis = sides[np.argmax(np.hypot(sides[:,0], sides[:,1]))]
+    axis = axis / np.hypot(axis[0], axis[1])
+
+    # rotate the polygon so the long axis is along x
+    rotation = np.array([[axis[0], axis[1]], [-axis[1], axis[0]]])
+    origin = np.asarray(polygon.exterior.coords[0])
+
+    def to_local(coords):
+        return (np.asarray(coords) - origin) @ rotation.T
+
+    def to_global(coords):
+        return coords @ rotation + origin
+
+    local = Polygon(to_local(polygon.exterior.coords), [to_local(interior.coords) for interior in polygon.interiors])
+
+    minx, miny, maxx, maxy = local.bounds
+
+    rows = np.arange(miny + distance/2, maxy, distance)
+
+    # too thin for a half line offset ~ one line through the middle
+    if len(rows) == 0:
+        rows = [(miny + maxy) / 2]
+
+    paths = []
+    zigzag = []
+
+    for y in rows:
+
+        line = LineString([(minx - 1, y), (maxx + 1, y)]).intersection(local)
+
+        if line.geom_type == "LineString" and not line.is_empty:
+            pieces = [line]
+        elif line.geom_type == "MultiLineString":
+            pieces = list(line.geoms)
+        else:
+            pieces = []
+
+        if len(pieces) == 1:
+            piece = coords_array(pieces[0])
+
+            # every other line runs backwards
+            if (piece[0,0] > piece[-1,0]) != (len(zigzag) % 2 == 1):
+                piece = piece[::-1]
+
+            zigzag.append(piece)
+            continue
+
+        if zigzag:
+            paths.append(np.concatenate(zigzag))
+            zigzag = []
+
+        paths.extend(coords_array(piece) for piece in pieces)
+
+    if zigzag:
+        paths.append(np.concatenate(zigzag))
+
+    return [to_global(path) for path in paths]
@@ -0,0 +1,126 @@
+'''
+Lazy, depth first isocontour generation
+
+distance_transform_diff computes every offset ring of a polygon before any path is generated. Here each
+contour family produces its rings one level at a time while the path builders consume them, so only the
+rings of the family being generated are in memory. The branches of a family are walked depth first, so the
+pending siblings are the only other geometry that is held
+'''
+
+from shapely_utilities import inset_exterior
+
+
+class ContourFamily:
+
+    '''
+    polygon: the polygon whose exterior is the first ring of the family
+    distance: offset distance between the rings
+    skip: number of rings dropped from the start of the family (boundaries)
+
+    Iterating yields the rings of the family until the polygon splits or vanishes. The rings are offset the first
+    time an iteration reaches them and kept by the family, so the start index attempts that iterate it again do not
+    offset them again ~ they are released with the family once its path is generated
+    '''
+
+    def __init__(self, polygon, distance, skip=0):
+        self.polygon = polygon
+        self.distance = distance
+        self.skip = skip
+
+        # rings offset so far, and the polygon of the last one
+        self._rings = []
+        self._polygon = polygon
+        self._level = 0
+
+        self._branches = None
+
+
+    def __iter__(self):
+
+        k = 0
+
+        while True:
+
+            if k < len(self._rings):
+                yield self._rings[k]
+                k += 1
+            elif self._branches is None:
+                self._next_ring()
+            else:
+                return
+
+
+    '''
+    Offset the next ring of the family, or find its branches if the polygon splits or vanishes
+    '''
+    def _next_ring(self):
+
+        while self._branches is None:
+
+            # same offset as distance_transform_diff ~ the first ring is the exterior of the polygon itself
+            if self._level > 0:
+                polygon = inset_exterior(self._polygon, self.distance)
+
+                if polygon.is_empty:
+                    self._branches = []
+                    return
+
+                # MultiPolygons are the result of concave shapes ~ each polygon starts a new family
+                if polygon.geom_type == "MultiPolygon":
+                    self._branches = list(polygon.geoms)
+                    return
+
+                self._polygon = polygon
+
+            self._level += 1
+
+            if self._level > self.skip:
+                self._rings.append(self._polygon.exterior)
+                return
+
+
+    '''
+    Polygons the family splits into ~ runs the family to its end if no iteration has reached it yet
+    '''
+    @property
+    def branches(self):
+
+        if self._branches is None:
+            for _ in self:
+                pass
+
+        return self._branches
+
+
+'''
+Generate the path of a polygon while its isocontours are generated
+ - generate: function(contour family, distance, **kwargs) that builds the path of one contour family
+ - merge: function(path, merged branches, distance) that joins the path of a family with the merged paths of its branches
+ - the families are walked depth first with a stack, and the result is the same as generating the full tree first
+'''
+def reduce_lazy(polygon, distance, generate, merge, boundaries=0, **kwargs):
+
+    family = ContourFamily(polygon, distance, boundaries)
+
+    # each level of the stack keeps the path of its family, the branches left to walk and the merged branches
+    stack = [(generate(family, distance, **kwargs), iter(family.branches), [])]
+
+    while True:
+
+        path, branches, merged = stack[-1]
+
+        branch = next(branches, None)
+
+        if not branch is None:
+            family = ContourFamily(branch, distance)
+            stack.append((generate(family, distance, **kwargs), iter(family.branches), []))
+            continue
+
+        stack.pop()
+
+        result = merge(path, merged, distance)
+
+        if not stack:
+            return result
+
+        stack[-1][2].append(result)
@@ -0,0 +1,289 @@
+'''
+Machine time estimation of gcode
+
+Segments and commands do not say how long the machine runs: short segments never reach the feedrate, corners
+slow down, and every pen or extruder lift adds a stop. MachineTime reads gcode (the GcodeWriter output) and
+simulates a firmware planner the way Marlin or Grbl run it:
+ - every move follows a trapezoid ~ accelerate from its entry speed, cruise at its feedrate, decelerate to its exit speed
+ - the speed at a corner is limited so the change of velocity stays below the jerk
+ - the planner only looks ahead a buffer of moves, and the last move in the buffer is planned to stop
+
+Only the commands the GcodeWriter writes are read: G0/G1 moves (X, Y, Z, E, F), G28 homing, G4 dwells and the
+G90/G91 and M82/M83 position modes. Coordinates are in mm and F in mm/min
+'''
+
+from collections import deque
+from math import sqrt, inf
+
+
+'''
+Time of a trapezoid move ~ the move reaches the peak of a triangle if it is too short to cruise
+'''
+def block_time(length, entry, exit, nominal, acceleration):
+
+    d_accelerate = (nominal**2 - entry**2) / (2 * acceleration)
+    d_decelerate = (nominal**2 - exit**2) / (2 * acceleration)
+
+    if d_accelerate + d_decelerate <= length:
+        return (nominal - entry) / acceleration + (nominal - exit) / acceleration + (length - d_accelerate - d_decelerate) / nominal
+
+    peak = sqrt((2 * acceleration * length + entry**2 + exit**2) / 2)
+
+    return (peak - entry) / acceleration + (peak - exit) / acceleration
+
+
+class MachineTime:
+
+    '''
+    feedrate: speed of G1 moves in mm/s until the gcode sets one with F
+    travel_feedrate: speed of rapid G0 moves and homing in mm/s
+    z_feedrate: highest speed of the z axis in mm/s
+    acceleration: acceleration of every move in mm/s^2
+    jerk: largest change of velocity in mm/s allowed at a corner without slowing down for it
+    buffer: number of moves the planner looks ahead
+    '''
+
+    def __init__(self, feedrate=25, travel_feedrate=100, z_feedrate=10, acceleration=1000, jerk=8, buffer=16):
+
+        assert feedrate > 0 and travel_feedrate > 0 and z_feedrate > 0
+        assert acceleration > 0 and jerk >= 0 and buffer > 0
+
+        self.feedrate = feedrate
+        self.travel_feedrate = travel_feedrate
+        self.z_feedrate = z_feedrate
+        self.acceleration = acceleration
+        self.jerk = jerk
+        self.buffer = buffer
+
+        self.reset()
+
+
+    '''
+    Start a new estimate at the origin with the machine at rest
+    '''
+    def reset(self):
+
+        # x, y, z, e
+        self.position = [0.0, 0.0, 0.0, 0.0]
+
+        # modal feedrate set by F in mm/s (None for the default feedrate)
+        self.modal_feed = None
+
+        self.absolute = True
+        self.absolute_e = False
+
+        # moves waiting in the planner ~ [length, nominal speed, max entry speed, kind, planned entry speed]
+        self.blocks = deque()
+
+        # direction and speed of the last move, to limit the corner with the next one (None at rest)
+        self.previous = None
+
+        # exit speed of the last move that ran
+        self.speed = 0.0
+
+        # a lift is counted when the pen or extruder leaves the work after drawing
+        self.drawing = False
+
+        self.times = {"print": 0.0, "travel": 0.0, "other": 0.0}
+        self.lifts = 0
+
+
+    '''
+    Plan the buffer backwards from a stop at its last move ~ the highest entry speed each move can still brake from
+    '''
+    def plan(self):
+
+        exit = min(self.blocks[-1][1], self.jerk)
+
+        for block in reversed(self.blocks):
+            block[4] = min(block[2], sqrt(exit**2 + 2 * self.acceleration * block[0]))
+            exit = block[4]
+
+
+    '''
+    Run the first move of the buffer
+    '''
+    def execute(self):
+
+        self.plan()
+
+        length, nominal, limit, kind, _ = self.blocks.popleft()
+
+        a = self.acceleration
+
+        entry = min(self.speed, limit)
+
+        # the next move is entered at its planned speed, or the machine stops after the last move
+        exit = self.blocks[0][4] if self.blocks else min(nominal, self.jerk)
+        exit = min(exit, sqrt(entry**2 + 2 * a * length))
+        exit = max(exit, sqrt(max(entry**2 - 2 * a * length, 0)))
+
+        self.times[kind] += block_time(length, entry, exit, nominal, a)
+        self.speed = exit
+
+
+    '''
+    Run every move in the buffer and stop
+    '''
+    def flush(self):
+
+        while self.blocks:
+            self.execute()
+
+        self.speed = 0.0
+        self.previous = None
+
+
+    '''
+    Add a move to the planner
+     - direction: unit vector of the move in x, y, z, e
+     - kind: "print", "travel" or "other" (lifts and retractions)
+    '''
+    def add_block(self, length, speed, direction, kind):
+
+        # the corner speed keeps the change of velocity below the jerk ~ a move from rest can start at the jerk
+        if self.previous is None:
+            limit = min(speed, self.jerk)
+        else:
+            previous_direction, previous_speed = self.previous
+
+            change = sqrt(sum((d - p)**2 for d, p in zip(direction, previous_direction)))
+
+            limit = min(speed, previous_speed, self.jerk / change if change > 0 else inf)
+
+        self.previous = (direction, speed)
+
+        self.blocks.append([length, speed, limit, kind, 0.0])
+
+        if len(self.blocks) > self.buffer:
+            self.execute()
+
+
+    '''
+    Move to a target ~ values are the words of the command (X, Y, Z, E, F)
+    '''
+    def move(self, values, rapid=False):
+
+        if "F" in values:
+            self.modal_feed = values["F"] / 60
+
+        target = list(self.position)
+
+        for k, axis in enumerate("XYZ"):
+            if axis in values:
+                target[k] = values[axis] if self.absolute else target[k] + values[axis]
+
+        if "E" in values:
+            target[3] = values["E"] if self.absolute_e else target[3] + values["E"]
+
+        dx, dy, dz, de = [t - p for t, p in zip(target, self.position)]
+
+        self.position = target
+
+        length = sqrt(dx**2 + dy**2 + dz**2)
+
+        # moves of the extruder alone (retractions) run along the e axis
+        if length > 0:
+            direction = (dx / length, dy / length, dz / length, 0.0)
+        elif de != 0:
+            length = abs(de)
+            direction = (0.0, 0.0, 0.0, 1.0 if de > 0 else -1.0)
+        else:
+            return
+
+        if rapid:
+            speed = self.travel_feedrate
+            kind = "travel"
+        else:
+            speed = self.feedrate if self.modal_feed is None else self.modal_feed
+            kind = "print" if dx != 0 or dy != 0 else "other"
+
+        # the z axis is slower ~ the move is slowed so its z speed stays below the limit
+        if dz != 0:
+            speed = min(speed, self.z_feedrate * length / abs(dz))
+
+        if kind == "print":
+            self.drawing = True
+        elif self.drawing and (dz != 0 or de < 0):
+            self.lifts += 1
+            self.drawing = False
+
+        self.add_block(length, speed, direction, kind)
+
+
+    '''
+    Read one line of gcode
+    '''
+    def read_line(self, line):
+
+        words = line.split(";")[0].upper().split()
+
+        if not words:
+            return
+
+        command = words[0]
+        values = {w[0]: float(w[1:]) for w in words[1:] if len(w) > 1}
+
+        if command in ("G0", "G00", "G1", "G01"):
+            self.move(values, rapid=command in ("G0", "G00"))
+
+        # homing moves the listed axes (or all of them) back to 0
+        elif command == "G28":
+            axes = [w for w in words[1:] if w in ("X", "Y", "Z")] or ["X", "Y", "Z"]
+
+            absolute = self.absolute
+            self.absolute = True
+            self.move({axis: 0.0 for axis in axes}, rapid=True)
+            self.absolute = absolute
+
+        # the planner empties before a dwell
+        elif command == "G4":
+            self.flush()
+            self.times["other"] += values.get("P", 0) / 1000 + values.get("S", 0)
+
+        elif command == "G90":
+            self.absolute = True
+        elif command == "G91":
+            self.absolute = False
+        elif command == "M82":
+            self.absolute_e = True
+        elif command == "M83":
+            self.absolute_e = False
+
+
+    '''
+    Read gcode text ~ can be called once per path, the planner carries on between calls
+    '''
+    def read_text(self, text):
+
+        for line in text.splitlines():
+            self.read_line(line)
+
+
+    '''
+    Estimate a gcode file ~ returns the results
+    '''
+    def read_file(self, filename):
+
+        self.reset()
+
+        with open(filename) as f:
+            for line in f:
+                self.read_line(line)
+
+        return self.results()
+
+
+    '''
+    Run the moves left in the planner and return a dictionary of the times in seconds and the lift count
+    '''
+    def results(self):
+
+        self.flush()
+
+        return {
+            "Machine Time": sum(self.times.values()),
+            "Print Time": self.times["print"],
+            "Travel Time": self.times["travel"],
+            "Lifts": self.lifts,
+        }
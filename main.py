@@ -8,21 +8,41 @@ import argparse
 
 parser = argparse.ArgumentParser()
 
-parser.add_argument("filename", help="path to image file", type=str)
+parser.add_argument("filename", help="path to image file, or a vector file (.svg, .dxf, .wkb, .geojson)", type=str)
 parser.add_argument("distance", help="line thickness", type=float)
 
 group = parser.add_mutually_exclusive_group()
 group.add_argument("-s", "--spiral", action='store_true')
 group.add_argument("-fs", "--fermat", action='store_true')
 group.add_argument("-cfs", "--connected_fermat", action='store_true')
+group.add_argument("-a", "--all", help="run all path types sharing the isocontours and spirals", action='store_true')
 
 parser.add_argument("-o","--optimize", help="enable polygon optimization", action='store_true')
 parser.add_argument("-p", "--plot", help="enable plotting", action='store_true')
 parser.add_argument("-g", "--gcode", help="enable output", type=str)
 parser.add_argument("-m", "--metrics", help="enable metrics", action='store_true')
+parser.add_argument("--machine_time", help="estimate how long the machine runs the gcode ~ optional settings: feedrate, travel feedrate, z feedrate (mm/s), acceleration (mm/s^2), jerk (mm/s), planner buffer", type=float, nargs="*")
+parser.add_argument("--cache-dir", help="cache isocontours and paths in this directory", type=str)
+parser.add_argument("-l", "--layers", help="layer height ~ treats the filename as a stack of slices (directory or multi-page TIFF)", type=float)
+parser.add_argument("--time_budget", help="seconds allowed per polygon before returning the best attempt so far", type=float)
+parser.add_argument("--attempt_budget", help="start index attempts allowed before returning the best attempt so far", type=int)
+parser.add_argument("--sweep", help="additional distances to run, sharing the image conversion and isocontours", type=float, nargs="+")
+parser.add_argument("--workers", help="processes to generate the sibling branches of each polygon in parallel (the layers with -l)", type=int)
+parser.add_argument("--islands", help="send small islands and slivers to a cheap contour or zigzag fill ~ optional thresholds: min area, min perimeter, contour radius, zigzag radius (in line distances)", type=float, nargs="*")
+parser.add_argument("--regions", help="split each polygon into this many regions at its branch points and fill them in parallel with --workers", type=int)
+parser.add_argument("--cut", help="with --regions, cut each polygon into strips of equal area before splitting it at its branch points (not with -cfs, lowers the fill quality)", action='store_true')
+parser.add_argument("--tile", help="read the image in tiles of this many pixels and trace the shapes on the seams again (.npy images are memory-mapped)", type=int)
+parser.add_argument("--adaptive", help="downsample the image until a line distance covers this many pixels (default 4) and print the error against full resolution", type=float, nargs="?", const=4)
+parser.add_argument("--render", help="render the paths headless to this image file (.png, .svg, ...)", type=str)
+parser.add_argument("--grid", help="integer grid mode with this many grid units per pixel (default 1000) ~ exact integer isocontour offsets", type=float, nargs="?", const=1000)
+parser.add_argument("--coarse", help="search the spiral start point on contours simplified by this many line distances (default 0.25) once the first attempt fails, falling back to the exhaustive search", type=float, nargs="?", const=0.25)
+parser.add_argument("--tolerance", help="fraction of differing pixels for a slice to reuse the previous layer", type=float, default=0)
 
 import cv2
 from matplotlib import pyplot
+from matplotlib.collections import LineCollection
+import numpy as np
+import shapely
 
 import os
 
@@ -35,11 +55,23 @@ import spiral as S
 import fermat_spiral as FS
 
 # optimization module
-from optimization import optimization
+from optimization import optimization, optimize_polygon
 
 # add-on modules
 from metrics import Metrics
+from machine_time import MachineTime
 from gcode import GcodeWriter
+from cache import ResultCache
+from stack import load_stack, generate_layers
+from sweep import sweep
+from budget import Budget
+from islands import IslandClassifier
+from tiles import convert_tiled
+from pyramid import convert_adaptive, pyramid_error
+from vectors import is_vector, load_vectors
+from render import Renderer
+from integer_grid import snap
+from engine import configure, current_settings, default_settings, settings_namespace
 
 
 
@@ -47,38 +79,135 @@ from gcode import GcodeWriter
 Plot a single path
 '''
 def plot_path(path, color=None):
-    
-    X = []
-    Y = []
 
-    for p in path:
-        X.append(p[0])
-        Y.append(p[1])
+    path = np.asarray(path, dtype=float).reshape(-1, 2)
         
-    pyplot.plot(X,Y,c=color)
+    pyplot.plot(path[:,0],path[:,1],c=color)
 
 '''
 Plot a list of paths
+ - every path is drawn by a single line collection, and the intersections are found with the indexed search
 '''
 def plot_recursive_path(total_path, color=None, endpoints=False, intersections=False):
     
+    lines = []
     rest = []
     
     for path in total_path:
         
-        if type(path) is list:
-            plot_path(path, color)
-            if intersections:
-                for i in self_intersections_binary(LineString(path)):
+        if np.ndim(path) == 2:
+            lines.append(np.asarray(path, dtype=float))
+            if intersections and len(path) > 1:
+                for i in self_intersections(LineString(path)):
                     pyplot.scatter(i.x,i.y, c='red')
         else:
             rest.append(path)
-            
-    plot_path(rest, color)
+
+    if rest:
+        lines.append(np.asarray(rest, dtype=float).reshape(-1, 2))
+
+    lines = [line for line in lines if len(line) > 1]
+
+    # without a color each path takes the next color of the cycle, like one plot call per path
+    if color is None:
+        cycle = pyplot.rcParams["axes.prop_cycle"].by_key()["color"]
+        color = [cycle[k % len(cycle)] for k in range(len(lines))]
+
+    pyplot.gca().add_collection(LineCollection(lines, colors=color))
+    pyplot.gca().autoscale()
     pyplot.gca().invert_yaxis()
 
 
 
+'''
+Get the path type selected by the arguments
+'''
+def get_path_type(args):
+
+    if args.spiral:
+        return "S"
+    elif args.fermat:
+        return "FS"
+    elif args.connected_fermat:
+        return "CFS"
+
+    raise NotImplementedError("SPIRAL TYPE NOT INPUT")
+
+
+
+'''
+Generate a multi layer print from a stack of slices
+'''
+def main_stack(args, path_type):
+
+    assert args.layers > 0
+    assert not args.gcode is None and args.gcode.split('.')[-1] == 'gcode'
+
+    # each layer is generated in a worker with only the path type and the cache ~ the options of a single image run are not taken
+    assert args.islands is None and args.regions is None and not args.cut
+    assert args.time_budget is None and args.attempt_budget is None
+    assert not args.metrics and args.machine_time is None and args.render is None
+    assert args.sweep is None and args.tile is None and args.adaptive is None
+
+    images = load_stack(args.filename)
+
+    # the workers generate the distinct layers in parallel
+    layers = generate_layers(images, args.distance, path_type, args.optimize, args.tolerance, workers=args.workers, cache_dir=args.cache_dir)
+
+    gc = GcodeWriter(filename=args.gcode, scale = 0.1)
+    gc.convert_layers(layers, args.layers)
+
+
+'''
+Run the path generation over several distances
+'''
+def main_sweep(args, polygons, path_type):
+
+    distances = [args.distance] + args.sweep
+
+    assert all(d > 0 for d in distances)
+
+    # the distances run in parallel with the whole path generation of each in one worker ~ the per polygon options are not taken
+    assert args.islands is None and args.regions is None and not args.cut
+    assert args.machine_time is None and args.render is None
+
+    cache = None if args.cache_dir is None else ResultCache(args.cache_dir, namespace=settings_namespace(current_settings()))
+
+    budget = None
+
+    if not args.time_budget is None or not args.attempt_budget is None:
+        budget = Budget(args.time_budget, args.attempt_budget)
+
+    # the fill metrics are only computed when they are printed
+    metrics = Metrics(segments=True, commands=True, curvature=False, underfill=args.metrics, overfill=args.metrics)
+
+    all_results, table = sweep(polygons, distances, path_type, workers=args.workers, metrics=metrics, filename=os.path.basename(args.filename), cache=cache, budget=budget)
+
+    for distance, results in all_results.items():
+
+        if args.plot:
+            pyplot.figure(path_type + " " + str(distance))
+            plot_recursive_path(results)
+
+        if not args.gcode is None:
+            assert args.gcode.split('.')[-1] == 'gcode'
+
+            gc = GcodeWriter(filename=args.gcode[:-len('.gcode')] + "_" + str(distance) + ".gcode", scale = 0.1)
+            gc.convert(results)
+
+    if args.metrics:
+        for row in table:
+            print(row)
+
+    if not budget is None:
+        for fallback in budget.fallbacks:
+            print("FALLBACK", fallback)
+
+    if args.plot:
+        pyplot.show()
+
+
+
 def main():
     
     args = parser.parse_args()
@@ -88,43 +217,140 @@ def main():
 
     assert distance > 0
 
-    # read the image
-    image = cv2.imread(filename,0)
-    assert not image is None
-    
-    polygons = convert(image, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=args.optimize, simplify=1)
+    assert args.grid is None or args.grid > 0
+    assert args.coarse is None or args.coarse > 0
+
+    # the grid, its tolerances and the start point search are set before any isocontour is generated
+    settings = default_settings(args.grid)
+    settings["coarse"] = args.coarse
+
+    configure(settings)
+
+    if not args.layers is None:
+        main_stack(args, get_path_type(args))
+        return
+
+    # vector files are loaded as polygons directly, without rasterizing
+    if is_vector(filename):
+        polygons = load_vectors(filename)
+
+        if args.optimize:
+            polygons = [optimize_polygon(polygon) for polygon in polygons]
+
+    # read the image ~ tiled images are never held in memory at once
+    elif not args.tile is None:
+        polygons = convert_tiled(filename, args.tile, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=args.optimize, simplify=1, workers=args.workers)
+    else:
+        image = cv2.imread(filename,0)
+        assert not image is None
+
+        polygons = convert(image, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=args.optimize, simplify=1)
+
+        # the working resolution is picked from the distance, and compared against the full resolution polygons
+        if not args.adaptive is None:
+            full = polygons
+            polygons = convert_adaptive(image, distance, args.adaptive, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=args.optimize, simplify=1)
+
+            print("PYRAMID", pyramid_error(full, polygons, distance, args.adaptive))
+
+    if not args.grid is None:
+        polygons = snap(polygons, args.grid)
+
+    if not args.sweep is None:
+        main_sweep(args, polygons, get_path_type(args))
+        return
 
     path_type = ""
 
-    # determine which path to create
+    cache = None if args.cache_dir is None else ResultCache(args.cache_dir, namespace=settings_namespace(current_settings()))
+
+    budget = None
+
+    if not args.time_budget is None or not args.attempt_budget is None:
+        budget = Budget(args.time_budget, args.attempt_budget)
+
+    assert args.regions is None or args.regions > 0
+
+    # strip paths can not be joined into one connected path
+    assert not (args.cut and args.connected_fermat)
+
+    machine = None
+
+    if not args.machine_time is None:
+        assert len(args.machine_time) <= 6
+        machine = MachineTime(*args.machine_time[:5], *[int(b) for b in args.machine_time[5:]])
+
+    islands = None
+
+    if not args.islands is None:
+        islands = IslandClassifier(*args.islands)
+
+    # determine which path to create ~ single path types are generated as they are consumed
     if args.spiral:
-        results = S.execute(polygons, distance)
+        results = S.iter_execute(polygons, distance, cache=cache, budget=budget, workers=args.workers, islands=islands, regions=args.regions, cut_lines=args.cut)
         path_type = "S"
     elif args.fermat:
-        results = FS.execute(polygons, distance, connected=False)
+        results = FS.iter_execute(polygons, distance, connected=False, cache=cache, budget=budget, workers=args.workers, islands=islands, regions=args.regions, cut_lines=args.cut)
         path_type = "FS"
     elif args.connected_fermat:
-        results = FS.execute(polygons, distance, connected=True)
+        results = FS.iter_execute(polygons, distance, connected=True, cache=cache, budget=budget, workers=args.workers, islands=islands, regions=args.regions, cut_lines=args.cut)
         path_type = "CFS"
+    elif args.all:
+        all_results = FS.execute_all(polygons, distance, cache=cache, budget=budget, islands=islands)
     else:
         raise NotImplementedError("SPIRAL TYPE NOT INPUT")
 
+    if not args.all:
+        all_results = {path_type: results}
 
-    if args.plot:
-        plot_recursive_path(results)
-        pyplot.show()
+    for path_type, results in all_results.items():
 
-    
-    if not args.gcode is None:
-        assert args.gcode.split('.')[-1] == 'gcode'
-        gc = GcodeWriter(filename=args.gcode, scale = 0.1)
-        gc.convert(results)
-    
+        # plotting needs every path at once
+        if args.plot:
+            results = list(results)
+            pyplot.figure(path_type)
+            plot_recursive_path(results)
 
-    if args.metrics:
-        m = Metrics(segments=True, commands=True, curvature=False, underfill=True, overfill=True)
-        print(m.measure(results, os.path.basename(filename), path_type, distance, polygons))
+        # the renderer keeps only the points that land on a new pixel as the paths go by
+        if not args.render is None:
+            renderer = Renderer(shapely.total_bounds(polygons))
+            results = renderer.stream(results)
+
+        # the gcode writer and the metrics take the paths one at a time
+        if not args.gcode is None:
+            assert args.gcode.split('.')[-1] == 'gcode'
+
+            # write one file per path type when running all of them
+            gcode_filename = args.gcode if not args.all else args.gcode[:-len('.gcode')] + "_" + path_type + ".gcode"
+
+            gc = GcodeWriter(filename=gcode_filename, scale = 0.1)
+            results = gc.stream(results)
+
+        # the machine time is measured from the gcode the writer makes of the paths, with the same scale
+        if args.metrics or not machine is None:
+            m = Metrics(segments=True, commands=True, curvature=False, underfill=args.metrics, overfill=args.metrics, machine_time=not machine is None, machine=machine, scale=0.1)
+            print(m.measure(results, os.path.basename(filename), path_type, distance, polygons))
+        else:
+            for _ in results:
+                pass
+
+        # write one image per path type when running all of them
+        if not args.render is None:
+            render_filename = args.render if not args.all else os.path.splitext(args.render)[0] + "_" + path_type + os.path.splitext(args.render)[1]
+            renderer.save(render_filename)
+
+    # report the polygons that returned their best attempt instead of a valid path
+    if not budget is None:
+        for fallback in budget.fallbacks:
+            print("FALLBACK", fallback)
+
+    # report how many polygons each fill strategy took
+    if not islands is None:
+        print("ISLANDS", islands.counts)
+
+    if args.plot:
+        pyplot.show()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
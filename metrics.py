@@ -5,15 +5,31 @@ Take in a path and extract different metrics from the path
 import numpy as np
 from shapely.geometry import LineString, MultiPolygon
 
+from shapely_utilities import path_length
+from gcode import GcodeWriter
+from machine_time import MachineTime
+
+import integer_grid
+
 class Metrics:
 
-    def __init__(self, segments=True, commands=True, curvature=False, underfill=False, overfill=False):
+    '''
+    machine_time: estimate how long the machine runs the gcode of the paths (see MachineTime)
+    machine: the MachineTime estimator with the machine settings (None for the defaults)
+    scale: gcode units per path unit, as given to the GcodeWriter
+    '''
+
+    def __init__(self, segments=True, commands=True, curvature=False, underfill=False, overfill=False, machine_time=False, machine=None, scale=0.1):
 
         self.segments = segments
         self.commands = commands
         self.curvature = curvature
         self.underfill = underfill
         self.overfill = overfill
+        self.machine_time = machine_time
+
+        self.machine = MachineTime() if machine is None else machine
+        self.scale = scale
 
 
     '''
@@ -44,26 +60,15 @@ class Metrics:
     Calculate average angle change of the path
     '''
     def _path_curvature(self, path):      
-        
-        sharpness = 0
 
-        for i1 in range(len(path)):
-            
-            i0,i1,i2 = self.neighbors(i1, len(path))
-            
-            p0 = path[i0]
-            p1 = path[i1]
-            p2 = path[i2]
-                    
-            a0 = np.arctan2(p1[1]-p0[1], p1[0]-p0[0])
-            a2 = np.arctan2(p2[1]-p1[1], p2[0]-p1[0])
-
-            # get the angle change
-            da = a2-a0
-            
-            sharpness += abs(da)
-            
-        return sharpness
+        # angle of each segment, the path wraps around like the neighbor indices
+        d = np.roll(path, -1, axis=0) - path
+        a = np.arctan2(d[:,1], d[:,0])
+
+        # get the angle change at each vertex
+        da = a - np.roll(a, 1)
+
+        return np.abs(da).sum()
 
     '''
     Get the total angle change. This should be directly comparable between paths
@@ -73,7 +78,7 @@ class Metrics:
         sharpness = 0
 
         for path in total_path:
-            sharpness += self._path_curvature(np.array(path))
+            sharpness += self._path_curvature(np.asarray(path, dtype=float))
 
         return sharpness
 
@@ -89,7 +94,7 @@ class Metrics:
         fill_area = fill_polygons.area    
 
         # get all of the path fills
-        path_areas = [LineString(path).buffer(distance/2+epsilon) for path in total_path]
+        path_areas = [LineString(path).buffer(distance/2+epsilon) for path in total_path if len(path) > 1]
 
         # get the area of the difference ~ these are the remaining areas of the starting polygon that are not filled
         for path_area in path_areas:
@@ -99,43 +104,69 @@ class Metrics:
         return fill_polygons.area/fill_area
 
     
+    '''
+    Get the ideal area (no overlap) and the actual area of a single path
+    '''
+    def _path_overfill(self, path, distance, epsilon=0.0000001):
+
+        if len(path) < 2:
+            return 0, 0
+
+        # ideal path area with no overlap
+        ideal = path_length(np.asarray(path, dtype=float)) * distance
+
+        # actual path area ~ in grid mode the lines are exactly a distance apart, and GEOS drops the gaps between them unless the buffer is widened by epsilon
+        widen = epsilon if not integer_grid.GRID_SCALE is None else 0
+
+        actual = LineString(path).buffer(distance/2+widen, cap_style=2, join_style=2).area
+
+        return ideal, actual
+
+
     '''
     Find "overfill" areas of the polygon ~ returns a percentage from the total
     '''
-    def measure_overfill(self, total_path, distance):
+    def measure_overfill(self, total_path, distance, epsilon=0.0000001):
 
         ideal = 0
         actual = 0
 
         # calculate the area difference
         for path in total_path:
-            
-            # ideal path area with no overlap
-            ideal += LineString(path).length * distance
-
-            # actual path area
-            actual += LineString(path).buffer(distance/2, cap_style=2, join_style=2).area
-
-        '''
-        calculate the overfill
-         - the ideal area assumes each line segment is a rectangle. Even changing angles preserve the area of the line segments
-         - the actual area calculates the rectangular buffer of the path. Overlapped areas are merged, meaning the area is lowered by one of the overlap areas
-         - to get the true overlap, the area of the overlap needs to be doubled
-        '''
+            i, a = self._path_overfill(path, distance, epsilon)
+            ideal += i
+            actual += a
+
+        return self._overfill(ideal, actual)
+
+
+    '''
+    calculate the overfill
+     - the ideal area assumes each line segment is a rectangle. Even changing angles preserve the area of the line segments
+     - the actual area calculates the rectangular buffer of the path. Overlapped areas are merged, meaning the area is lowered by one of the overlap areas
+     - to get the true overlap, the area of the overlap needs to be doubled
+    '''
+    def _overfill(self, ideal, actual):
+
         overlap = ideal - actual
 
         return overlap * 2 / ideal
 
     '''
     Return a dictionary of measurements. Unused measurements are returned as np.Nan
+     - total_path can be any iterable of paths (like a generator from execute), it is consumed in a single pass
+     - with machine_time, the times in seconds and the lift count of the gcode the GcodeWriter writes are added (see MachineTime)
     '''
-    def measure(self, total_path, filename, method, distance, polygons=None):
+    def measure(self, total_path, filename, method, distance, polygons=None, epsilon=0.0000001):
 
         assert type(distance) is float or type(distance) is int
 
         if self.underfill:
             assert not polygons is None
 
+        if self.curvature:
+            raise NotImplementedError
+
         measurements = {
             "Filename": filename,
             "Method": method,
@@ -147,14 +178,48 @@ class Metrics:
             "Overfill": np.nan,
         }
 
+        segments = 0
+        commands = 0
+        ideal = 0
+        actual = 0
+
+        if self.underfill:
+            fill_polygons = MultiPolygon(polygons)
+            fill_area = fill_polygons.area
+
+        # the gcode of each path is simulated as it would be written, without writing the file
+        if self.machine_time:
+            writer = GcodeWriter(scale=self.scale)
+
+            self.machine.reset()
+            self.machine.read_text(writer.header())
+
+        # each path is measured and released before the next one is generated
+        for path in total_path:
+
+            segments += 1
+            commands += len(path)
+
+            if self.underfill and len(path) > 1:
+                fill_polygons = fill_polygons.difference(LineString(path).buffer(distance/2+epsilon))
+
+            if self.overfill:
+                i, a = self._path_overfill(path, distance, epsilon)
+                ideal += i
+                actual += a
+
+            if self.machine_time and len(path):
+                self.machine.read_text(writer.command_path(path))
+
         if self.segments:
-            measurements["Segments"] = len(total_path)
+            measurements["Segments"] = segments
         if self.commands: 
-            measurements["Commands"] = self.measure_commands(total_path)
-        if self.curvature:
-            raise NotImplementedError
+            measurements["Commands"] = commands
         if self.underfill:
-            measurements["Underfill"] = self.measure_underfill(total_path, polygons, distance)
+            measurements["Underfill"] = fill_polygons.area/fill_area
         if self.overfill:
-            measurements["Overfill"] = self.measure_overfill(total_path, distance)
+            measurements["Overfill"] = self._overfill(ideal, actual)
+        if self.machine_time:
+            self.machine.read_text("G28;\n")
+            measurements.update(self.machine.results())
         return measurements
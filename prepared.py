@@ -0,0 +1,118 @@
+'''
+Prepared lines for repeated queries
+
+The path generation asks the same line for distances, projections and intersections many times in a row
+(the binary search of calculate_point_contour, the branches spliced into a root). Each of those calls on a
+plain LineString scans every segment. A PreparedLine is built once per line:
+ - the line is prepared with shapely.prepare, so predicates use the GEOS index
+ - an STRtree over its segments answers distance, nearest and intersection queries without a full scan
+ - the arc length of each coordinate turns a segment and a local position into a position along the line
+
+Every query takes an array of geometries (or positions), so a loop can be replaced by one indexed call
+'''
+
+import numpy as np
+
+import shapely
+from shapely import STRtree
+from shapely.geometry import LineString
+
+
+class PreparedLine:
+
+    '''
+    line: LineString or (N,2) path
+    '''
+
+    def __init__(self, line):
+
+        self.coords = shapely.get_coordinates(line) if isinstance(line, LineString) else np.asarray(line, dtype=float).reshape(-1, 2)
+        self.line = LineString(self.coords)
+
+        shapely.prepare(self.line)
+
+        self.segments = shapely.linestrings(np.stack([self.coords[:-1], self.coords[1:]], axis=1))
+        self.tree = STRtree(self.segments)
+
+        # arc length of each coordinate
+        self.arc = np.concatenate([[0], np.cumsum(shapely.length(self.segments))])
+        self.length = self.arc[-1]
+
+
+    '''
+    Get the index of the segment nearest to each point ~ the first one if several are equally near, like project
+    '''
+    def nearest(self, points):
+
+        points = np.asarray(points, dtype=object)
+
+        p, s = self.tree.query_nearest(points, all_matches=True)
+
+        k = np.full(len(points), len(self.segments))
+        np.minimum.at(k, p, s)
+
+        return k
+
+
+    '''
+    Get the distance from each geometry to the line ~ a float for a single geometry
+    '''
+    def distance(self, geoms):
+
+        single = isinstance(geoms, shapely.Geometry)
+
+        geoms = np.atleast_1d(np.asarray(geoms, dtype=object))
+
+        (p, _), d = self.tree.query_nearest(geoms, return_distance=True)
+
+        distances = np.full(len(geoms), np.inf)
+        np.minimum.at(distances, p, d)
+
+        return distances[0] if single else distances
+
+
+    '''
+    Get the position of each point along the line
+    '''
+    def project(self, points):
+
+        points = np.asarray(points, dtype=object)
+
+        k = self.nearest(points)
+
+        return self.arc[k] + shapely.line_locate_point(self.segments[k], points)
+
+
+    '''
+    Get the point at each position along the line ~ (N,2) array
+     - each point is interpolated on its own segment, instead of walking the line from the start for every position
+    '''
+    def interpolate(self, positions):
+
+        positions = np.asarray(positions, dtype=float)
+
+        k = np.clip(np.searchsorted(self.arc, positions, side="right") - 1, 0, len(self.segments) - 1)
+
+        return shapely.get_coordinates(shapely.line_interpolate_point(self.segments[k], positions - self.arc[k]))
+
+
+    '''
+    Check if each geometry intersects the line (prepared predicate)
+    '''
+    def intersects(self, geoms):
+        return shapely.intersects(self.line, geoms)
+
+
+    '''
+    Get the intersection of a geometry with the line ~ only the segments the index finds are intersected
+     - returns an empty geometry collection if they do not intersect
+    '''
+    def intersection(self, geom):
+
+        hits = self.tree.query(geom, predicate="intersects")
+
+        if len(hits) == 0:
+            return shapely.GeometryCollection()
+
+        # the pieces of neighbouring segments share their endpoints
+        return shapely.union_all(shapely.intersection(self.segments[np.sort(hits)], geom))
@@ -0,0 +1,97 @@
+'''
+Resolution-adaptive conversion tied to the line distance
+
+The contours from convert keep one vertex per pixel step whatever the line distance is, and every offset and
+path stage pays for them. Here the image is downsampled with an image pyramid until a line distance covers
+only a few pixels, the contours are found at that resolution and scaled back to image coordinates, and the
+polygons are simplified with a tolerance that is a fraction of the distance (capping the vertex density per
+unit length)
+
+Coarser levels lose detail narrower than a few working pixels, so pyramid_error measures the adaptive polygons
+against the full resolution ones
+'''
+
+import cv2
+import numpy as np
+
+import shapely
+
+from shapely_conversion import generate_border_lines, create_contour_families
+from optimization import optimize_polygon
+
+
+'''
+Get the number of pyramid levels for a line distance ~ each level halves the resolution
+ - pixels: the smallest number of pixels a line distance may cover at the working resolution
+'''
+def pyramid_levels(distance, pixels=4):
+
+    assert pixels > 0
+
+    return max(0, int(np.floor(np.log2(distance / pixels))))
+
+
+'''
+Downsample a binary image by a number of pyramid levels ~ the smoothed image is thresholded back to binary
+'''
+def downsample(image, levels):
+
+    image = np.where(image > 0, 255, 0).astype(np.uint8)
+
+    for _ in range(levels):
+        image = cv2.pyrDown(image)
+        image = np.where(image > 127, 255, 0).astype(np.uint8)
+
+    return image
+
+
+'''
+Convert an image into a list of shapely polygons at a resolution picked from the line distance
+ - pixels: the smallest number of pixels a line distance may cover at the working resolution
+ - density: simplification tolerance as a fraction of the distance (the fixed simplify tolerance is used if it is larger)
+'''
+def convert_adaptive(image, distance, pixels=4, density=0.1, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=False, simplify=1):
+
+    assert simplify >= 0 and density >= 0
+
+    levels = pyramid_levels(distance, pixels)
+    scale = 2**levels
+
+    coords, offsets, heirarchy = generate_border_lines(downsample(image, levels), approximation)
+
+    # pixel i of the working image is centered on pixel i*scale of the original
+    polygons = create_contour_families(coords * scale, offsets, heirarchy)
+
+    # contours run through the centers of the edge pixels, so a larger working pixel shrinks the shape more ~ grow it back to the full resolution edge
+    if levels > 0:
+        polygons = list(shapely.buffer(polygons, (scale - 1) / 2, join_style="mitre"))
+
+    if optimize:
+        polygons = [optimize_polygon(polygon) for polygon in polygons]
+
+    # the fixed tolerance is in working pixels
+    tolerance = max(simplify * scale, density * distance)
+
+    if tolerance > 0:
+        polygons = list(shapely.simplify(polygons, tolerance))
+
+    return polygons
+
+
+'''
+Compare adaptive polygons with the full resolution polygons ~ returns a dictionary of the error
+ - the area error is the area covered by only one of the two, as a fraction of the full resolution area
+ - the boundary error is the hausdorff distance between the two boundaries
+'''
+def pyramid_error(full, adaptive, distance, pixels=4):
+
+    full = shapely.union_all(shapely.make_valid(full))
+    adaptive = shapely.union_all(shapely.make_valid(adaptive))
+
+    return {
+        "Levels": pyramid_levels(distance, pixels),
+        "Vertices": int(shapely.get_num_coordinates(adaptive)),
+        "Full Vertices": int(shapely.get_num_coordinates(full)),
+        "Area Error": full.symmetric_difference(adaptive).area / full.area if full.area > 0 else 0,
+        "Boundary Error": full.boundary.hausdorff_distance(adaptive.boundary) if not full.is_empty and not adaptive.is_empty else 0,
+    }
@@ -0,0 +1,230 @@
+'''
+Region decomposition of a single polygon
+
+The pool of generate_tree (branches) only starts once the whole isocontour tree of a polygon is built, and the
+offsets of a large polygon are most of its work. Here the polygon is split into regions before its tree exists:
+the largest region is offset only until its first branch point, the polygons it splits into become new regions,
+and this repeats until there are enough regions for the pool. Each region then generates its own isocontours and
+path in a worker (reduce_lazy), the contour families above the branch points are generated alongside, and the
+results are joined with the merge of the path type (merge_separate or merge_connected). The path is the same as
+filling the polygon in one piece
+
+A polygon that does not branch early (a large convex shape) can also be cut into strips of equal area with
+straight cut lines. The strips are shrunk by half a line distance from each cut, so the outer rings on both
+sides of a cut are a line distance apart, and each strip is filled like a polygon of its own. The strips are
+separate paths, and the ends of shapes inside the band around a cut are lost, so cutting trades fill quality
+for parallelism ~ cuts that leave slivers are dropped, and connected fermat spirals are not cut (the ends of a
+strip path are not next to its neighbour, so they can not be spliced like a branch)
+'''
+
+import heapq
+
+import shapely
+from shapely.geometry import box
+
+from lazy_contours import ContourFamily, reduce_lazy
+from branches import generate_node
+
+
+'''
+Cut a polygon into strips of equal area across its longer side ~ returns the polygons of the strips
+ - the strips are shrunk by half a distance from each cut line
+ - a cut that leaves a piece narrower than a line distance against it is dropped, joining the strips on both sides
+'''
+def cut_polygon(polygon, parts, distance):
+
+    minx, miny, maxx, maxy = polygon.bounds
+
+    wide = maxx - minx >= maxy - miny
+
+    low, high = (minx, maxx) if wide else (miny, maxy)
+
+    def strip(a, b):
+        return box(a, miny, b, maxy) if wide else box(minx, a, maxx, b)
+
+    area = polygon.area
+
+    # each cut is found with a binary search for the position with the next share of the area before it
+    cuts = []
+
+    for k in range(1, parts):
+
+        a = cuts[-1] if cuts else low
+        b = high
+
+        for _ in range(30):
+            m = (a + b) / 2
+
+            if polygon.intersection(strip(low, m)).area < area * k / parts:
+                a = m
+            else:
+                b = m
+
+        cuts.append((a + b) / 2)
+
+    tolerance = distance * 1e-6
+
+    while cuts:
+
+        edges = [low] + cuts + [high]
+
+        pieces = []
+
+        # index of the cut to drop
+        drop = None
+
+        for k in range(len(edges) - 1):
+
+            a = edges[k] + (distance / 2 if k > 0 else 0)
+            b = edges[k+1] - (distance / 2 if k < len(cuts) else 0)
+
+            # the cuts are closer than a line distance
+            if b <= a:
+                drop = k if k < len(cuts) else k - 1
+                break
+
+            # concave shapes can fall apart into several polygons in one strip
+            piece = polygon.intersection(strip(a, b))
+
+            for p in shapely.get_parts(piece):
+
+                if p.geom_type != "Polygon" or p.is_empty:
+                    continue
+
+                p_low, p_high = (p.bounds[0], p.bounds[2]) if wide else (p.bounds[1], p.bounds[3])
+
+                # a sliver the cut leaves behind, or a shape too thin for a ring inside its exterior, can not hold its own path
+                if p_high - p_low < distance or p.buffer(-distance / 2).is_empty:
+                    if k < len(cuts) and p_high >= b - tolerance:
+                        drop = k
+                        break
+                    if k > 0 and p_low <= a + tolerance:
+                        drop = k - 1
+                        break
+
+                pieces.append(p)
+
+            if not drop is None:
+                break
+
+        if drop is None:
+            break
+
+        del cuts[drop]
+
+    # a polygon with every cut dropped is filled as it is
+    return pieces if cuts else [polygon]
+
+
+'''
+Split a polygon into regions at the branch points of its isocontour tree ~ returns the nodes and the indices of the top nodes
+ - each node is [item, child node indices, skipped rings], parents come before their children
+ - the item is a list of rings (a contour family above a branch point) or a polygon (a region filled in one piece)
+ - regions: number of regions (nodes without children) to split into ~ the largest region is split first
+ - cut_lines: cut the polygon into as many strips as regions before splitting at the branch points (see cut_polygon)
+'''
+def decompose(polygon, distance, regions, boundaries=0, cut_lines=False):
+
+    assert regions > 0
+
+    pieces = cut_polygon(polygon, regions, distance) if cut_lines and regions > 1 else [polygon]
+
+    nodes = [[piece, [], boundaries] for piece in pieces]
+    top = list(range(len(nodes)))
+
+    leaves = len(nodes)
+
+    # largest regions first ~ a region that does not branch keeps its rings and is not split again
+    heap = [(-piece.area, i) for i, piece in enumerate(pieces)]
+    heapq.heapify(heap)
+
+    while heap and leaves < regions:
+
+        _, i = heapq.heappop(heap)
+
+        family = ContourFamily(nodes[i][0], distance, nodes[i][2])
+
+        nodes[i][0] = list(family)
+
+        for branch in family.branches:
+            nodes[i][1].append(len(nodes))
+            heapq.heappush(heap, (-branch.area, len(nodes)))
+            nodes.append([branch, [], 0])
+
+        leaves += max(len(family.branches) - 1, 0)
+
+    return nodes, top
+
+
+'''
+Generate the path of a region in a worker ~ returns the merged path and the fallbacks recorded by a fork of the budget
+'''
+def fill_region(generate, merge, polygon, distance, skip=0, budget=None):
+
+    if budget is None:
+        return reduce_lazy(polygon, distance, generate, merge, skip), []
+
+    budget = budget.fork()
+
+    return reduce_lazy(polygon, distance, generate, merge, skip, budget=budget), budget.fallbacks
+
+
+'''
+Generate the path of a decomposed polygon ~ returns the merged path of each top node
+ - generate, merge: the functions of the path type (see reduce_lazy)
+ - executor: worker pool to fill the regions and contour families in parallel (None to run them in order, with the same result)
+'''
+def fill_regions(nodes, top, distance, generate, merge, executor=None, budget=None):
+
+    if executor is None:
+        results = [(generate(item, distance, budget=budget) if type(item) is list else reduce_lazy(item, distance, generate, merge, skip, budget=budget), [])
+                   for item, _, skip in nodes]
+    else:
+        # every region and family is independent, so they all start at once
+        futures = [executor.submit(generate_node, generate, item, distance, budget) if type(item) is list else executor.submit(fill_region, generate, merge, item, distance, skip, budget)
+                   for item, _, skip in nodes]
+
+        results = [future.result() for future in futures]
+
+    if not budget is None:
+        for _, fallbacks in results:
+            budget.fallbacks.extend(fallbacks)
+
+    # children come after their parents, so walking the nodes backwards merges every child before its parent
+    merged = {}
+
+    for i in range(len(nodes) - 1, -1, -1):
+
+        item, children, _ = nodes[i]
+        path = results[i][0]
+
+        merged[i] = merge(path, [merged.pop(child) for child in children], distance) if type(item) is list else path
+
+    return [merged[i] for i in top]
+
+
+'''
+Decompose and fill a polygon ~ returns the merged path of each top node
+ - cache: the paths of the whole polygon are cached under the path type of the method, the skipped boundaries and,
+   for cut polygons, the number of strips (the decomposition alone does not change the path)
+'''
+def fill_decomposed(polygon, distance, regions, generate, merge, boundaries=0, cut_lines=False, executor=None, budget=None, cache=None, method=""):
+
+    if not cache is None:
+        key = cache.key(polygon, distance, "{} regions {} {}".format(method, boundaries, regions if cut_lines else 0))
+        paths = cache.get(key)
+
+        if not paths is None:
+            return paths
+
+    # fallbacks are not cached, a later run with a larger budget may find a valid path
+    fallbacks = 0 if budget is None else len(budget.fallbacks)
+
+    nodes, top = decompose(polygon, distance, regions, boundaries, cut_lines)
+
+    paths = fill_regions(nodes, top, distance, generate, merge, executor, budget)
+
+    if not cache is None and (budget is None or len(budget.fallbacks) == fallbacks):
+        cache.put(key, paths)
+
+    return paths
@@ -0,0 +1,134 @@
+'''
+Headless rendering of large path sets
+
+Plotting a path with pyplot.plot is one artist per path, and every point is drawn even when thousands of them
+fall in the same pixel. The Renderer reduces each path to the points that move to a new pixel of the output
+image as the paths go by, and draws all of them at once with a single LineCollection on an Agg canvas, so no
+display is needed. The image type (PNG, SVG, PDF...) is picked from the output filename
+'''
+
+import numpy as np
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+
+from shapely.geometry import LineString
+
+from shapely_utilities import self_intersections
+
+
+'''
+Drop the points of a path that stay in the same pixel as the point before ~ the first and last points are kept
+ - origin: position of pixel (0, 0)
+ - pixel: size of a pixel in path units
+'''
+def reduce_points(path, origin, pixel):
+
+    if len(path) < 3:
+        return path
+
+    cells = np.floor((path - origin) / pixel).astype(np.int64)
+
+    keep = np.ones(len(path), dtype=bool)
+    keep[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+    keep[-1] = True
+
+    return path[keep]
+
+
+class Renderer:
+
+    '''
+    bounds: (minx, miny, maxx, maxy) of the drawing, the polygon bounds
+    pixels: size of the longer side of the image in pixels
+    linewidth: width of the lines in points
+    color: color of the lines
+    intersections: mark the self intersections of each path in red
+    '''
+
+    def __init__(self, bounds, pixels=2000, linewidth=0.5, color="black", intersections=False):
+
+        assert pixels > 0
+
+        minx, miny, maxx, maxy = bounds
+
+        self.bounds = bounds
+        self.pixels = pixels
+        self.linewidth = linewidth
+        self.color = color
+        self.intersections = intersections
+
+        self.origin = np.array([minx, miny])
+        self.pixel = max(maxx - minx, maxy - miny, 1e-9) / pixels
+
+        # reduced paths and intersection points collected so far
+        self.lines = []
+        self.points = []
+
+        # points of the total path that are not part of a path (plotted as one line, like plot_recursive_path)
+        self.rest = []
+
+
+    '''
+    Reduce a path and keep it for drawing
+    '''
+    def add(self, path):
+
+        if np.ndim(path) != 2:
+            self.rest.append(path)
+            return
+
+        path = np.asarray(path, dtype=float)
+
+        if self.intersections and len(path) > 1:
+            self.points.extend((p.x, p.y) for p in self_intersections(LineString(path)))
+
+        self.lines.append(reduce_points(path, self.origin, self.pixel))
+
+
+    '''
+    Collect the paths while passing them on ~ renders a stream without holding the full paths
+    '''
+    def stream(self, total_path):
+
+        for path in total_path:
+            self.add(path)
+            yield path
+
+
+    '''
+    Draw the collected paths and save the image
+    '''
+    def save(self, filename):
+
+        lines = self.lines
+
+        if self.rest:
+            lines = lines + [reduce_points(np.asarray(self.rest, dtype=float).reshape(-1, 2), self.origin, self.pixel)]
+
+        minx, miny, maxx, maxy = self.bounds
+
+        # the figure is sized so one pixel of the image is one pixel of the reduction
+        dpi = 100
+        width = max(maxx - minx, 1e-9) / self.pixel
+        height = max(maxy - miny, 1e-9) / self.pixel
+
+        figure = Figure(figsize=(max(width, 1) / dpi, max(height, 1) / dpi), dpi=dpi)
+        FigureCanvasAgg(figure)
+
+        axes = figure.add_axes([0, 0, 1, 1])
+        axes.set_axis_off()
+
+        axes.add_collection(LineCollection([line for line in lines if len(line) > 1], linewidths=self.linewidth, colors=self.color))
+
+        if self.points:
+            points = np.asarray(self.points)
+            axes.scatter(points[:,0], points[:,1], c="red", s=4)
+
+        # image coordinates ~ y is down
+        axes.set_xlim(minx, maxx)
+        axes.set_ylim(maxy, miny)
+        axes.set_aspect("equal")
+
+        figure.savefig(filename, dpi=dpi)
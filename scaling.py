@@ -0,0 +1,283 @@
+'''
+Synthetic scaling workloads
+
+Generate parameterized polygons (stars, plates with holes, wide and deep combs, and rings), run each stage of
+the path generation over a sweep of sizes, and fit the empirical complexity exponent of each stage against the
+measured vertex, hole or branch count (or perimeter) the workload grows
+'''
+
+import argparse
+import cProfile
+import pstats
+
+from time import perf_counter
+
+import numpy as np
+
+from shapely.geometry import Point, Polygon, box
+from shapely.ops import unary_union
+
+from shapely_utilities import distance_transform_diff
+from contour_tree import ContourTree
+
+import spiral as S
+import fermat_spiral as FS
+
+
+# functions that are timed individually inside of each stage
+PROFILED = ["cut", "self_intersections", "self_intersections_binary", "combine_paths"]
+
+
+'''
+Star with n outer vertices ~ the vertex count grows with n while the area stays constant
+'''
+def star(n, radius=100, inner=0.6):
+
+    angles = np.linspace(0, 2*np.pi, 2*n, endpoint=False)
+    radii = np.where(np.arange(2*n) % 2 == 0, radius, radius*inner)
+
+    return Polygon(np.column_stack((radius + radii*np.cos(angles), radius + radii*np.sin(angles))))
+
+
+'''
+Square plate with m circular holes on a grid ~ the hole count grows with m
+'''
+def plate(m, size=200, resolution=4):
+
+    columns = int(np.ceil(np.sqrt(m)))
+    pitch = size / (columns + 1)
+    hole_radius = pitch / 4
+
+    holes = []
+
+    for i in range(m):
+        x = pitch * (i % columns + 1)
+        y = pitch * (i // columns + 1)
+        holes.append(Point(x, y).buffer(hole_radius, resolution).exterior.coords[::-1])
+
+    return Polygon(box(0, 0, size, size).exterior.coords, holes=holes)
+
+
+'''
+Comb with n teeth, where every tooth is a stem that ends in a smaller comb ~ each level adds a level of branching to the isocontour tree
+ - levels: number of nested combs (0 is the spine alone)
+'''
+def comb(n, levels=2, width=400):
+
+    def _comb(x0, y0, w, level):
+
+        # the stems are thinner than the combs they carry, so the offsets split at every stem
+        thickness = w / 4
+
+        parts = [box(x0, y0, x0 + w, y0 + thickness)]
+
+        if level == 0:
+            return parts
+
+        pitch = w / n
+
+        for i in range(n):
+            left = x0 + i * pitch + pitch / 10
+            tooth = pitch * 4 / 5
+
+            parts.append(box(left + tooth * 0.45, y0 + thickness, left + tooth * 0.55, y0 + thickness + tooth / 8))
+            parts.extend(_comb(left, y0 + thickness + tooth / 8, tooth, level - 1))
+
+        return parts
+
+    return unary_union(_comb(0, 0, width, levels))
+
+
+'''
+Ring with a fixed vertex count ~ the path length grows with the radius
+'''
+def ring(radius, width=20, resolution=16):
+
+    outer = Point(radius, radius).buffer(radius, resolution)
+    inner = Point(radius, radius).buffer(radius - width, resolution)
+
+    return outer.difference(inner)
+
+
+# workload name -> (generator, default sweep of sizes, measured count the exponents are fitted against)
+# comb widens the isocontour tree and comb_depth deepens it, so comparing their exponents separates depth from the branch count
+WORKLOADS = {
+    "star": (star, [8, 16, 32, 64, 128], "Vertices"),
+    "plate": (plate, [1, 4, 9, 16, 25], "Holes"),
+    "comb": (lambda n: comb(n, levels=1), [2, 4, 8, 16], "Branches"),
+    "comb_depth": (lambda levels: comb(2, levels, width=2000), [1, 2, 3, 4, 5], "Branches"),
+    "ring": (ring, [50, 100, 200, 400, 800], "Perimeter"),
+}
+
+
+# stage name -> function of (polygon, distance)
+STAGES = {
+    "distance_transform": lambda polygon, distance: distance_transform_diff(polygon, distance),
+    "spiral": lambda polygon, distance: S.execute([polygon], distance),
+    "fermat": lambda polygon, distance: FS.execute([polygon], distance, connected=False),
+    "connected_fermat": lambda polygon, distance: FS.execute([polygon], distance, connected=True),
+}
+
+
+'''
+Run one stage under the profiler ~ returns the total time and the cumulative time of each profiled function
+'''
+def profile_stage(stage, polygon, distance):
+
+    profiler = cProfile.Profile()
+
+    start = perf_counter()
+    try:
+        profiler.runcall(stage, polygon, distance)
+    except Exception:
+        # failing shapes are reported as missing samples instead of stopping the sweep ~ their partial times are not valid either
+        return {name: np.nan for name in PROFILED + ["total"]}
+
+    total = perf_counter() - start
+
+    stats = pstats.Stats(profiler).stats
+
+    times = {name: 0.0 for name in PROFILED}
+
+    for (_, _, name), (_, _, _, cumulative, _) in stats.items():
+        if name in times:
+            times[name] += cumulative
+
+    times["total"] = total
+
+    return times
+
+
+'''
+Measure the counts of a polygon that the cost can grow with ~ the branches and depth are those of its isocontour tree
+'''
+def measure_polygon(polygon, distance):
+
+    tree = ContourTree.from_polygon(polygon, distance)
+
+    return {
+        "Vertices": len(polygon.exterior.coords) + sum(len(i.coords) for i in polygon.interiors),
+        "Holes": len(polygon.interiors),
+        "Branches": len(tree),
+        "Depth": int(tree.depth.max()),
+        "Perimeter": polygon.length,
+    }
+
+
+'''
+Fit the exponent k of time ~ c * size^k using a least squares fit in log-log space
+'''
+def fit_exponent(sizes, times):
+
+    sizes = np.asarray(sizes, dtype=float)
+    times = np.asarray(times, dtype=float)
+
+    # ignore failed or unmeasurable samples
+    valid = np.isfinite(times) & (times > 0) & (sizes > 0)
+
+    if np.count_nonzero(valid) < 2:
+        return np.nan
+
+    k, _ = np.polyfit(np.log(sizes[valid]), np.log(times[valid]), 1)
+
+    return k
+
+
+'''
+Run every stage over the sweep of a workload ~ returns a list of rows (one per size and stage) and the fitted exponents
+'''
+def sweep(workload, distance, sizes=None, stages=None):
+
+    generator, default_sizes, against = WORKLOADS[workload]
+
+    sizes = default_sizes if sizes is None else sizes
+    stages = list(STAGES) if stages is None else stages
+
+    rows = []
+
+    for size in sizes:
+
+        polygon = generator(size)
+
+        counts = measure_polygon(polygon, distance)
+
+        for stage in stages:
+            times = profile_stage(STAGES[stage], polygon, distance)
+
+            row = {
+                "Workload": workload,
+                "Size": size,
+                "Stage": stage,
+            }
+            row.update(counts)
+            row.update(times)
+            rows.append(row)
+
+    exponents = []
+
+    for stage in stages:
+
+        stage_rows = [row for row in rows if row["Stage"] == stage]
+
+        exponent = {"Workload": workload, "Stage": stage, "Against": against}
+
+        # the exponents are fitted against the measured count, not the size parameter of the generator
+        for name in PROFILED + ["total"]:
+            exponent[name] = fit_exponent([row[against] for row in stage_rows], [row[name] for row in stage_rows])
+
+        exponents.append(exponent)
+
+    return rows, exponents
+
+
+'''
+Print a list of dictionaries as an aligned table
+'''
+def print_table(rows):
+
+    if not rows:
+        return
+
+    columns = list(rows[0])
+
+    def fmt(value):
+        return "{:.4g}".format(value) if isinstance(value, float) else str(value)
+
+    widths = [max(len(c), *(len(fmt(row[c])) for row in rows)) for c in columns]
+
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+
+    for row in rows:
+        print("  ".join(fmt(row[c]).rjust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="fit complexity exponents on synthetic polygons")
+    parser.add_argument("distance", help="line thickness", type=float)
+    parser.add_argument("-w", "--workloads", help="workloads to run", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--stages", help="stages to run", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--sizes", help="override the sweep sizes", nargs="+", type=int)
+    parser.add_argument("-v", "--verbose", help="print the timing of every sample", action='store_true')
+
+    args = parser.parse_args()
+
+    assert args.distance > 0
+
+    all_rows = []
+    all_exponents = []
+
+    for workload in args.workloads:
+        rows, exponents = sweep(workload, args.distance, args.sizes, args.stages)
+        all_rows.extend(rows)
+        all_exponents.extend(exponents)
+
+    if args.verbose:
+        print_table(all_rows)
+        print()
+
+    print_table(all_exponents)
+
+
+if __name__ == "__main__":
+    main()
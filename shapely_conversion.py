@@ -6,77 +6,86 @@ Convert input binary images into shapely polygons
 
 import cv2
 
-from shapely.geometry import Polygon
+import numpy as np
+
+import shapely
 from optimization import optimize_polygon
 
 '''
-Convert an input binary image into a formatted list of contours with heirarch information
- - this returns all of the contours and heirarchy information
- - returns a list of tuples --> (list of points, heirarchy)
+Convert an input binary image into arrays of contours with heirarchy information
+ - coords: every contour point in one (N,2) array
+ - offsets: contour k is coords[offsets[k]:offsets[k+1]]
+ - heirarchy: (next, previous, first child, parent) of each contour
 '''
 def generate_border_lines(image, approximation = cv2.CHAIN_APPROX_SIMPLE):
 
     # cv2.RETR_CCOMP outputs parent-children relationships in the heirarchy
     contours,heirarchy = cv2.findContours(image, cv2.RETR_CCOMP, approximation)  
 
-    contour_list = []
+    if heirarchy is None:
+        return np.empty((0, 2)), np.zeros(1, dtype=np.int64), np.empty((0, 4), dtype=np.int64)
 
-    for contour,heirarchy in zip(contours, heirarchy[0]):
-        point_list = []
-        for point in contour:
-            point_list.append(tuple(point[0]))
-            
-        contour_list.append((point_list, heirarchy))
+    # each contour is an (n,1,2) array ~ joined into one buffer instead of converting point by point
+    coords = np.concatenate(contours).reshape(-1, 2).astype(float)
+    offsets = np.concatenate([[0], np.cumsum([len(contour) for contour in contours])])
 
-    return contour_list
+    return coords, offsets, heirarchy[0].astype(np.int64)
 
 '''
-Get all of the children of the parent contour using heirarchy information
+Get the position of every contour in its sibling list (the order the heirarchy links them in)
+ - the distance to the end of each list is found by pointer jumping, so every list is walked at once
 '''
-def get_children(contour_list, parent_contour):
+def sibling_order(heirarchy):
 
-    child_list = []
+    following = heirarchy[:,0].copy()
 
-    first_child_index = parent_contour[1][2]
-    child = contour_list[first_child_index]
-    child_list.append(child[0])
+    # number of siblings after each contour
+    remaining = (following != -1).astype(np.int64)
 
+    while np.any(following != -1):
+        linked = following != -1
+        remaining[linked] += remaining[following[linked]]
+        following[linked] = following[following[linked]]
 
-    # loop while there are more children
-    while not child[1][0] == -1:
-        next_child_index = child[1][0]
-        child = contour_list[next_child_index]
-        child_list.append(child[0])
-    
-    # return the list of children
-    return child_list
+    return -remaining
 
 '''
-Convert formatted list of contours with heirarchy info into polygons
+Convert the contours with heirarchy info into polygons
  - a shapely polygon has an exterior list of points, and a list of interiors (lists of points)
  - this uses the heirarchy info to find the interiors of an exterior polygon
+ - the rings of every polygon are sorted into place at once and built with one call to the shapely constructors
 '''
-def create_contour_families(contour_list):
+def create_contour_families(coords, offsets, heirarchy):
+
+    parents = heirarchy[:,3]
+
+    # the polygon of each contour is the parent contour, or the contour itself if it is an exterior
+    family = np.where(parents == -1, np.arange(len(parents)), parents)
+
+    lengths = np.diff(offsets)
+
+    # exteriors with less than 3 points are skipped with their holes
+    keep = lengths[family] > 2
+
+    # order the rings by polygon, exterior first then the holes in sibling order
+    position = np.where(parents == -1, -len(parents) - 1, sibling_order(heirarchy))
+    rings = np.lexsort((position, family))
+    rings = rings[keep[rings]]
 
-    family_list = []
+    if len(rings) == 0:
+        return []
 
-    # find the first parent contour
-    for contour in contour_list:
-        
-        # start with a parent contour
-        if contour[1][3]==-1:
+    # index of the polygon of each ring
+    polygon_index = np.cumsum(parents[rings] == -1) - 1
 
-            # if there are no children, create an empty family with only the parent contour
-            if contour[1][2] == -1:
-                child_list = []
-            # otherwise, find all of the children
-            else:
-                child_list = get_children(contour_list, contour)
+    # gather the points of the rings in order
+    ring_lengths = lengths[rings]
+    starts = np.repeat(offsets[rings] - np.concatenate([[0], np.cumsum(ring_lengths)[:-1]]), ring_lengths)
+    points = coords[starts + np.arange(len(starts))]
 
-            if len(contour[0]) > 2:
-                family_list.append(Polygon(contour[0], holes=child_list))
+    linear_rings = shapely.linearrings(points, indices=np.repeat(np.arange(len(rings)), ring_lengths))
 
-    return family_list
+    return list(shapely.polygons(linear_rings, indices=polygon_index))
 
 
 
@@ -89,14 +98,14 @@ def convert(image, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=False, simp
    
     assert simplify >= 0
 
-    contour_list = generate_border_lines(image, approximation)
+    coords, offsets, heirarchy = generate_border_lines(image, approximation)
 
-    polygons = create_contour_families(contour_list)
+    polygons = create_contour_families(coords, offsets, heirarchy)
 
     if optimize:
         polygons = [optimize_polygon(polygon) for polygon in polygons]
     
     if simplify > 0:
-        polygons = [polygon.simplify(simplify) for polygon in polygons]
+        polygons = list(shapely.simplify(polygons, simplify))
     
     return polygons
\ No newline at end of file
@@ -12,6 +12,13 @@ from shapely.geometry import CAP_STYLE, JOIN_STYLE
 
 from matplotlib import pyplot
 
+import numpy as np
+
+import shapely
+from shapely import STRtree
+
+import integer_grid
+
 '''
 Recursively run the distance transform on the input polygon
 - if result is empty, terminate with empty list
@@ -23,14 +30,14 @@ def distance_transform(polygon, distance):
     t = polygon.buffer(distance, cap_style = CAP_STYLE.flat, join_style = JOIN_STYLE.mitre)
     
     # if t is empty, return the empty list
-    if not t:
+    if t.is_empty:
         return []
         
     result = []
 
     # MultiPolygons are the result of concave shapes ~ distance transform creates multiple polygons
-    if t.type == "MultiPolygon":
-        for p in t:
+    if t.geom_type == "MultiPolygon":
+        for p in t.geoms:
             result.append([p])
             result[-1].extend(distance_transform(p, distance))
     else:
@@ -39,6 +46,19 @@ def distance_transform(polygon, distance):
         
     return result
 
+'''
+Shrink the exterior of a polygon by the distance without changing holes ~ one step of the distance transform
+ - in grid mode (integer_grid.GRID_SCALE) the step is done in integer coordinates
+'''
+def inset_exterior(polygon, distance):
+
+    if not integer_grid.GRID_SCALE is None:
+        return integer_grid.inset_exterior(polygon, distance, integer_grid.GRID_SCALE)
+
+    temp = polygon.exterior.buffer(distance, cap_style = CAP_STYLE.flat, join_style = JOIN_STYLE.mitre)
+
+    return polygon.difference(temp)
+
 '''
 Distance transform without changing holes
 '''
@@ -48,9 +68,7 @@ def distance_transform_diff(polygon, distance):
     if polygon.is_empty:
         return []
 
-    temp = polygon.exterior.buffer(distance, cap_style = CAP_STYLE.flat, join_style = JOIN_STYLE.mitre)
-    
-    polygon = polygon.difference(temp)
+    polygon = inset_exterior(polygon, distance)
 
     if polygon.is_empty:
         return []
@@ -58,8 +76,8 @@ def distance_transform_diff(polygon, distance):
     result = []
 
     # MultiPolygons are the result of concave shapes ~ distance transform creates multiple polygons
-    if polygon.type == "MultiPolygon":
-        for p in polygon:
+    if polygon.geom_type == "MultiPolygon":
+        for p in polygon.geoms:
             result.append([p.exterior])
             result[-1].extend(distance_transform_diff(p, distance))
     else:
@@ -82,9 +100,15 @@ def plot_poly(polygon):
 Plot all of the contours in the result of a distance transform
 '''
 def plot_contours(result):
-    for p in result:
+
+    # walk the nested lists with a stack instead of recursion
+    stack = [result]
+
+    while stack:
+        p = stack.pop()
+
         if type(p) is list:
-            plot_contours(p)
+            stack.extend(p[::-1])
         else:
             plot_poly(p)
 
@@ -99,24 +123,43 @@ def cut(line, distance):
     elif distance >= line.length:
         return [LineString(line), None]
     
-    coords = list(line.coords)
-    for i, p in enumerate(coords):
-        pd = line.project(Point(p))
-        if pd == distance:
+    coords = np.asarray(line.coords)
+
+    # a coordinate can not project past its own arc length, so the coordinates before the distance are skipped
+    arc = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(coords, axis=0).T))])
+    i = max(np.searchsorted(arc, distance - 0.000001) - 1, 0)
+
+    # project the coordinates in growing blocks ~ the first one at or past the distance is the cut
+    size = 16
+
+    while i < len(coords):
+
+        pd = shapely.line_locate_point(line, shapely.points(coords[i:i+size]))
+        past = np.flatnonzero(pd >= distance)
+
+        if len(past) == 0:
+            i += size
+            size *= 2
+            continue
+
+        i += past[0]
+
+        if pd[past[0]] == distance:
             return [
                 LineString(coords[:i+1]),
                 LineString(coords[i:])]
-        if pd > distance:
-            cp = line.interpolate(distance)
-            return [
-                LineString(coords[:i] + [(cp.x, cp.y)]),
-                LineString([(cp.x, cp.y)] + coords[i:])]
+
+        cp = shapely.get_coordinates(line.interpolate(distance))
+        return [
+            LineString(np.concatenate([coords[:i], cp])),
+            LineString(np.concatenate([cp, coords[i:]]))]
+
     # this is between the last point
     # this is to catch for linear rings (last point projection is 0)
-    cp = line.interpolate(distance)
+    cp = shapely.get_coordinates(line.interpolate(distance))
     return [
-        LineString(coords[:-1] + [(cp.x, cp.y)]),
-        LineString([(cp.x, cp.y)] + [coords[-1]])]
+        LineString(np.concatenate([coords[:-1], cp])),
+        LineString(np.concatenate([cp, coords[-1:]]))]
 
 
 '''
@@ -143,29 +186,46 @@ def cycle(contour, point):
 
 '''
 Find any self intersections in the input linestring
+ - the segment pairs are found with an STRtree, so only segments that cross anything are intersected
 '''
 def self_intersections(ls):
     
+    coords = np.asarray(ls.coords)
+
+    if len(coords) < 4:
+        return []
+
+    segments = shapely.linestrings(np.stack([coords[:-1], coords[1:]], axis=1))
+
+    # check for intersection only with the segments 2 past each segment (the next line cannot intersect with the current line)
+    i, j = STRtree(segments).query(segments, predicate="intersects")
+    keep = j >= i + 2
+    i, j = i[keep], j[keep]
+
+    if len(i) == 0:
+        return []
+
+    order = np.argsort(i, kind="stable")
+    i, j = i[order], j[order]
+
+    # the remaining path of each segment only needs to span the segments it intersects
+    first, index = np.unique(i, return_index=True)
+    start = np.minimum.reduceat(j, index)
+    end = np.maximum.reduceat(j, index)
+
+    remaining = [LineString(coords[s:e+2]) for s, e in zip(start, end)]
+    intersections = shapely.intersection(segments[first], remaining)
+
     intersection_points = []
-    
-    for i in range(len(ls.coords)-3):
-        
-        p0 = ls.coords[i]
-        p1 = ls.coords[i+1]
-    
-        remaining_path = LineString(ls.coords[i+2:])
-        test = LineString([p0,p1])
-        
-        # check for intersection only with the linestring coords 2 past the start (the next line cannot intersect with the current line)
-        if test.intersects(remaining_path):
-            
-            intersections = test.intersection(remaining_path)
-            
-            if intersections.type == "Point":
-                intersection_points.append(intersections)
+
+    for p in intersections:
+        for part in shapely.get_parts(p):
+
+            # segments that overlap (exact on the integer grid) intersect in a line ~ its end points are used
+            if part.geom_type == "Point":
+                intersection_points.append(part)
             else:
-                for p in intersections:
-                    intersection_points.append(p)
+                intersection_points.extend(shapely.points(shapely.get_coordinates(part)[[0, -1]]))
 
     return intersection_points
 
@@ -201,6 +261,54 @@ def self_intersections_binary(ls):
 
 
 
+'''
+Get the coordinates of a linestring as a (N,2) float64 array ~ None and empty geometries return an empty (0,2) array
+'''
+def coords_array(ls):
+
+    if ls is None or ls.is_empty:
+        return np.empty((0, 2))
+
+    return np.asarray(ls.coords, dtype=float)
+
+
+'''
+Join a list of paths end to end into one (N,2) array
+'''
+def concatenate(paths):
+
+    paths = [np.asarray(p, dtype=float).reshape(-1, 2) for p in paths]
+
+    if not paths:
+        return np.empty((0, 2))
+
+    return np.concatenate(paths)
+
+
+'''
+Remove repeated points from a path, keeping the first occurrence of each point
+'''
+def remove_duplicates(path):
+
+    if len(path) == 0:
+        return path
+
+    _, index = np.unique(path, axis=0, return_index=True)
+
+    return path[np.sort(index)]
+
+
+'''
+Get the length of a path without building a linestring
+'''
+def path_length(path):
+
+    if len(path) < 2:
+        return 0.0
+
+    return float(np.hypot(*np.diff(path, axis=0).T).sum())
+
+
 '''
 Reverse a input linestring ~ this is helpful for projection when the distance is ambiguous (intersections)
 '''
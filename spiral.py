@@ -5,15 +5,43 @@ Generate a space-filling spiral path on an input polygon
 '''
 
 from shapely_utilities import distance_transform_diff, cut, cycle, self_intersections_binary, reverse
+from shapely_utilities import coords_array, concatenate, remove_duplicates
 
 from shapely.geometry import Point, LineString, Polygon
 
+import shapely
+
+from cache import normalize, translate_paths
+from branches import generate_tree, merge_separate
+from contour_tree import ContourTree
+from lazy_contours import reduce_lazy
+from regions import fill_decomposed
+from prepared import PreparedLine
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
 from time import time
 
 import numpy as np
 
 from matplotlib import pyplot
 
+
+# tolerances and search steps of the path generation ~ module settings so an engine can configure them (engine.configure)
+
+# distance error accepted when searching for a point a radius away
+POINT_TOLERANCE = 0.000001
+
+# binary search steps for the reroute point of a contour
+SEARCH_STEPS = 10
+
+# distance at which a point is considered on a path when removing self intersections
+INTERSECTION_TOLERANCE = 0.000000001
+
+# simplification tolerance of the coarse start index search, in line distances (None for the exhaustive search only)
+COARSE_TOLERANCE = None
+
 '''
 Calculate a point a distance away from a position on the contour in a given direction
 this is where the contour is rerouted to the next spiral
@@ -36,7 +64,7 @@ def calculate_point(contour, position, radius, forward = True):
     start = contour.interpolate(position)
     
     # loop while the error is out of bounds 
-    while abs(error) > 0.000001:
+    while abs(error) > POINT_TOLERANCE:
         
         distance += error
         
@@ -62,27 +90,21 @@ def calculate_endpoint(contour, radius, forward = False):
     
     # set the direction of the error
     direction = 1 if forward else -1
-    
-    index = -1
 
     # reverse the contour coords to loop backwards through them
-    points = contour.coords[::-1]
+    points = np.asarray(contour.coords)[::-1]
 
     start = Point(points[0])
 
     # find the first distance past the position (all previous will be before the position)
-    for i, p in enumerate(points):
-        
-        dis = start.distance(Point(p))
-
-        if dis > radius:
-            index = i
-            break
+    past = np.flatnonzero(shapely.distance(start, shapely.points(points)) > radius)
     
     # if no point was valid, then we return "None"
-    if index == -1:
+    if len(past) == 0:
         return None
 
+    index = past[0]
+
     # set the index correctly to match reverse
     i1 = index
     i0 = (index-1)
@@ -94,6 +116,19 @@ def calculate_endpoint(contour, radius, forward = False):
 
     # the return of this must be a point
     point = distance_ring.intersection(line)
+
+    # the segment can pass between the vertices of the buffered circle, missing it or crossing it twice ~ intersect it with the exact circle instead
+    if point.is_empty or point.geom_type != "Point":
+        d = points[i1] - points[i0]
+        f = points[i0] - points[0]
+
+        a = d @ d
+        b = 2 * (f @ d)
+        c = f @ f - radius**2
+
+        t = (-b + np.sqrt(max(b*b - 4*a*c, 0))) / (2*a)
+
+        point = Point(points[i0] + t * d)
         
     return point
 
@@ -113,17 +148,18 @@ def calculate_point_contour(contour, previous, radius):
     if point is None:
         return point
     
-    # cut the path at the midpoint
+    # cut the path at the midpoint ~ prepared once for the distance queries of the search
     temp, _ = cut(contour, contour.length/2)
+    temp = PreparedLine(temp)
     
     # if the distance from the point to contour is the radius, return the point
-    if radius - point.distance(temp) < 0.000001:
+    if radius - temp.distance(point) < POINT_TOLERANCE:
         return point
     
     # else find a valid distance and binary search to find valid point
     distance = contour.project(point)
     
-    while point.distance(temp) < radius:
+    while temp.distance(point) < radius:
         
         distance -= radius
         
@@ -141,12 +177,12 @@ def calculate_point_contour(contour, previous, radius):
     point = contour.interpolate(position)
     
     
-    # binary search the distance ~ uses some arbitrary amount of iteration? ~ set to 10 rn
-    for _ in range(10):
+    # binary search the distance ~ uses some arbitrary amount of iteration? ~ SEARCH_STEPS (10 by default)
+    for _ in range(SEARCH_STEPS):
         
         error = error/2
         
-        if point.distance(temp) < radius:
+        if temp.distance(point) < radius:
             position -= error
         else:
             position += error
@@ -155,6 +191,21 @@ def calculate_point_contour(contour, previous, radius):
         
     return point
 
+'''
+Order of the start points of a contour ~ start index i is the vertex before the i-th shortest segment
+'''
+def start_order(contour):
+
+    # find the longest line segment in contour
+    points = shapely.points(np.asarray(contour.coords))
+
+    # each point is measured from the previous one (the first from the last)
+    distances = shapely.distance(points, np.roll(points, 1))
+
+    # sort the distances ~ the vertex before a segment starts it (the first segment is started by the last vertex)
+    return (np.argsort(distances) - 1) % len(points)
+
+
 '''
 Pick a good start point for spiral generation
 This should be a point that...
@@ -165,21 +216,9 @@ This should be a point that...
 
 def generate_start_point(contour, index):
 
-    # find the longest line segment in contour
-    distances = []
-
-    points = [Point(p) for p in contour.coords]
-
-    p0 = points[-1]
+    points = shapely.points(np.asarray(contour.coords))
 
-    for p1 in points:
-        distances.append(p1.distance(p0))
-        p0 = p1
-
-    # sort the distances
-    di = np.argsort(distances)
-
-    p0 = points[di[index]-1]
+    p0 = points[start_order(contour)[index]]
 
     # cycle the contour and return
     return cycle(contour, p0)
@@ -187,16 +226,21 @@ def generate_start_point(contour, index):
 
 '''
 Generate a spiral path from an input family of contours
+ - each contour is only needed until the next one is rerouted, so the family can be generated as it is read
 '''
 def spiral_path(contour_family, distance, start_index=0):
 
+    # pieces of the path, joined into one array at the end
     points = []
 
-    if not contour_family:
-        return points
-    
+    # the family can be a list or a lazy ContourFamily, so the rings are only read in order
+    rings = iter(contour_family)
+
     # set the start contour
-    contour = contour_family[0]
+    contour = next(rings, None)
+
+    if contour is None:
+        return concatenate(points)
     
     # set the starting point as start_index (arbitrary)
     # contour = LineString(list(contour.coords)[start_index:] + list(contour.coords)[:start_index])
@@ -205,19 +249,19 @@ def spiral_path(contour_family, distance, start_index=0):
     # calculate the end point a distance away from the end of the contour
     end = calculate_endpoint(contour, distance)
 
-    # if the end point was not found, return an empty list ~ contour is too small
+    # if the end point was not found, return an empty path ~ contour is too small
     if end is None:
-        return []
+        return concatenate([])
     
     # add the points before the reroute point to the path
     ls, _ = cut(contour, contour.project(end))                
-    points.extend(ls.coords)
+    points.append(coords_array(ls))
     
     # the previous contour is used to force the point away from acute angles
     previous = contour
     
     # loop through each "inner" contour
-    for contour in contour_family[1:]:
+    for contour in rings:
 
         # get the next start point
         start = contour.interpolate(contour.project(end))
@@ -233,18 +277,21 @@ def spiral_path(contour_family, distance, start_index=0):
 
         # add the points before the reroute point to the path
         ls, _ = cut(contour, contour.project(end))                
-        points.extend(ls.coords)
+        points.append(coords_array(ls))
         
         # set the previous to the processed contour so the next spiral generation can measure the distance from this
         previous = contour
         
-    return points
+    return concatenate(points)
 
 '''
 Resolve self intersections in the linestring
 '''
 def remove_intersections(path):
 
+    if len(path) < 2:
+        return path
+
     # convert the path into a linestring
     ls = LineString(path)
 
@@ -259,7 +306,8 @@ def remove_intersections(path):
     rls = reverse(ls)
 
     # sort the points by the projection distance from the center
-    intersections.sort(key=rls.project)   
+    intersections = np.asarray(intersections, dtype=object)
+    intersections = list(intersections[np.argsort(shapely.line_locate_point(rls, intersections), kind="stable")])
     
     while intersections:
         
@@ -270,7 +318,7 @@ def remove_intersections(path):
         p1, p2 = cut(rls, rls.project(p))
 
         if len(p1.coords) < 3 or len(p2.coords) < 3:
-            intersections.remove(p)
+            intersections.pop(0)
             continue
 
         # remove the cut point from each part
@@ -278,101 +326,279 @@ def remove_intersections(path):
         p2 = LineString(p2.coords[1:])
 
         # find the distance from p1 and p2 to the cut point ~ should be one 0
-        if p1.distance(p) < 0.000000001:
+        if p1.distance(p) < INTERSECTION_TOLERANCE:
             p1,remainder = cut(p1, p1.project(p))
         else:
             remainder,p2 = cut(p2, p2.project(p))
 
-        rls = LineString(list(p1.coords) + list(p2.coords))
+        rls = LineString(concatenate([coords_array(p1), coords_array(p2)]))
 
-        # remove the used point
-        intersections.remove(p)
-            
-        # remove any points on the remainder path
-        for test_p in intersections.copy():
-            
-            # set the epsilon distance to 1e-9 ~ this is "good enough" to be considered an intersection
-            if test_p.distance(remainder) < 0.000000001:
-                intersections.remove(test_p)
+        # remove the used point and any points on the remainder path
+        # set the epsilon distance to INTERSECTION_TOLERANCE (1e-9) ~ this is "good enough" to be considered an intersection
+        remaining = np.asarray(intersections[1:], dtype=object)
+
+        shapely.prepare(remainder)
+        intersections = list(remaining[~shapely.dwithin(remainder, remaining, INTERSECTION_TOLERANCE)])
 
     # convert trimmed result back into the path
-    path = list(reverse(rls).coords)   
+    path = coords_array(reverse(rls))
 
     return path
 
 
+'''
+Search the start index on simplified contours, where the attempts are cheap ~ returns the full resolution start index of the first coarse attempt that passes, or None
+ - tolerance: simplification tolerance of the rings
+ - convert: function(spiral path, distance) that returns the final path, or None if the attempt fails (the fermat checks)
+ - tried: full resolution start indices that already failed
+'''
+def coarse_start_index(contour_family, distance, tolerance, convert=None, tried=()):
+
+    rings = list(contour_family)
+
+    if not rings:
+        return None
+
+    coarse = [shapely.simplify(ring, tolerance) for ring in rings]
+    coarse = [c if not c.is_empty else ring for c, ring in zip(coarse, rings)]
+
+    order = start_order(coarse[0])
+    full_order = start_order(rings[0])
+
+    full_coords = np.asarray(rings[0].coords)
+
+    for i in range(len(order)):
+
+        # simplification keeps a subset of the vertices, so the coarse start vertex is a vertex of the full ring
+        k = np.flatnonzero(np.all(full_coords == np.asarray(coarse[0].coords)[order[i]], axis=1))[0]
+        j = int(np.flatnonzero(full_order == k)[0])
+
+        if j in tried:
+            continue
+
+        path = spiral_path(coarse, distance, i)
+
+        if not len(path):
+            return None
+
+        path = remove_duplicates(path)
+
+        if len(path) < 2 or not LineString(path).is_simple:
+            continue
+
+        if not convert is None and convert(path, distance) is None:
+            continue
+
+        return j
+
+    return None
+
+
+'''
+Generate the path of the start index picked by the coarse search at full resolution ~ returns None if there is no candidate or the refined path fails
+ - convert: function(spiral path, distance) that returns the final path, or None if the attempt fails
+ - tried: full resolution start indices that already failed
+'''
+def refine_path(contour_family, distance, convert=None, tried=()):
+
+    i = coarse_start_index(contour_family, distance, COARSE_TOLERANCE * distance, convert, tried)
+
+    if i is None:
+        return None
+
+    path = spiral_path(contour_family, distance, i)
+
+    if not len(path):
+        return None
+
+    path = remove_duplicates(path)
+
+    if len(path) >= 2 and not LineString(path).is_simple:
+        return None
+
+    return path if convert is None else convert(path, distance)
+
+
 '''
 Create a cleaned spiral path with no duplicate points or self intersections
+ - coarse: when COARSE_TOLERANCE is set and the first attempt fails, search the next start index on simplified contours ~ the exhaustive search is the fallback
 '''
-def generate_path(contour_family, distance, start_index=0):
+def generate_path(contour_family, distance, start_index=0, spirals=None, budget=None, coarse=True):
 
     # run the path algorithm until the path exterior is correct
     i = start_index
     done = False
 
-    outer_ring = contour_family[0]
+    outer_ring = next(iter(contour_family))
+
+    # best invalid attempt so far ~ (intersection count, path)
+    best = None
 
     while not done:
 
-        # generate the spiral path
-        path = spiral_path(contour_family, distance, i)
+        # reuse the attempt if it was already generated for this contour family
+        key = (id(outer_ring), distance, i)
+
+        if not spirals is None and key in spirals:
+            _, path, done = spirals[key]
+            i += 1
 
-        if path:
+        else:
 
-             # remove any duplicate points in the path
-            path = list(dict.fromkeys(path))
+            # generate the spiral path
+            path = spiral_path(contour_family, distance, i)
 
-            start_length = LineString(path)
+            if len(path):
 
-            # remove any self intersections in the path
-            # path = remove_intersections(path)
+                 # remove any duplicate points in the path
+                path = remove_duplicates(path)
 
-            done = LineString(path).is_simple
-            i += 1
+                # remove any self intersections in the path
+                # path = remove_intersections(path)
 
-        else:
-            done = True
+                done = len(path) < 2 or LineString(path).is_simple
+                i += 1
+
+            else:
+                done = True
+
+            # the outer ring is stored to keep its id valid while the memo is alive
+            if not spirals is None:
+                spirals[key] = (outer_ring, path, done)
+
+            # coarse to fine ~ shared attempts (spirals) are kept by start index, so only the exhaustive search uses them
+            elif not done and coarse and not COARSE_TOLERANCE is None and i == start_index + 1:
+                refined = refine_path(contour_family, distance, tried=(start_index,))
 
+                if not refined is None:
+                    return refined
+
+        # keep the attempt with the fewest self intersections, and return it when the budget runs out
+        if not done and not budget is None:
+
+            intersections = len(self_intersections_binary(LineString(path)))
+
+            if best is None or intersections < best[0]:
+                best = (intersections, path)
+
+            if budget.exhausted(i - start_index, len(outer_ring.coords) - start_index):
+                budget.fall_back("S", i - start_index, best[0])
+                return best[1]
+
+        # every start point was tried ~ shapes with few vertices (vector input) can run out
+        if not done and i >= len(outer_ring.coords):
+            return path
        
     return path
 
 
 '''
 Create a cleaned spiral path with no duplicate points or self intersections
+ - isocontours: nested lists (recursive, each branch is cached) or a ContourTree (iterative, only the whole tree is cached)
+ - executor: worker pool to generate the branches of the tree in parallel
 '''
-def generate_total_path(isocontours, distance):
-    total_path = []
-    contour_family = []
-    
-    # loop through each value in the result
-    for branch in isocontours:
-        if type(branch) is list:  
-            total_path.extend(generate_total_path(branch, distance))
-        else:
-            contour_family.append(branch)
+def generate_total_path(isocontours, distance, cache=None, spirals=None, budget=None, executor=None):
 
-        path = generate_path(contour_family, distance)
-    
-    total_path.append(path)
+    if not cache is None:
+        key = cache.key(isocontours, distance, "S")
+        total_path = cache.get(key)
+
+        if not total_path is None:
+            return total_path
+
+    # fallbacks are not cached, a later run with a larger budget may find a valid path
+    fallbacks = 0 if budget is None else len(budget.fallbacks)
+
+    if not executor is None:
+        total_path = generate_tree(isocontours, distance, executor, generate_path, merge_separate, budget, cache, "S")
+    elif isinstance(isocontours, ContourTree):
+        total_path = isocontours.reduce(generate_path, merge_separate, distance, spirals=spirals, budget=budget)
+    else:
+        total_path = []
+        contour_family = []
+        
+        # loop through each value in the result
+        for branch in isocontours:
+            if type(branch) is list:  
+                total_path.extend(generate_total_path(branch, distance, cache, spirals, budget))
+            else:
+                contour_family.append(branch)
+
+        total_path.append(generate_path(contour_family, distance, spirals=spirals, budget=budget))
+
+    if not cache is None and (budget is None or len(budget.fallbacks) == fallbacks):
+        cache.put(key, total_path)
 
     return total_path
 
 
 
 '''
-Generate the spiral fill
+Generate the spiral fill one polygon at a time ~ yields each finished path
+ - workers: number of processes to generate the branches of each polygon in parallel (None to run them in order)
+ - executor: an open worker pool to use instead of starting one for the call
+ - islands: IslandClassifier that sends small polygons to a cheap fill
+ - regions: number of regions to split each polygon into before its isocontours exist, filled in the pool (see regions)
+ - cut_lines: cut each polygon into strips with straight lines before splitting it at the branch points
 '''
-def execute(polygons, distance, boundaries=0):
+def iter_execute(polygons, distance, boundaries=0, cache=None, budget=None, workers=None, islands=None, executor=None, regions=None, cut_lines=False):
+
+    # sibling branches of each tree run in parallel in the pool ~ a pool that is passed in is reused and left open
+    if executor is None and not workers is None:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        pool = nullcontext(executor)
+
+    with pool as executor:
+
+        for i, polygon in enumerate(polygons):
+
+            if not budget is None:
+                budget.start(i)
+
+            # small islands and slivers get a cheap fill instead of the path generation
+            if not islands is None:
+                paths = islands.fill(polygon, distance)
+
+                if not paths is None:
+                    yield from paths
+                    continue
 
-    total_path = []
+            # identical shapes at different positions share the cached results
+            if not cache is None:
+                polygon, offset = normalize(polygon)
 
-    for polygon in polygons:
-        isocontours = [polygon.exterior] + distance_transform_diff(polygon, distance) 
+            # the regions generate their own isocontours in the pool ~ the cache keeps the paths of the whole polygon
+            if not regions is None:
+                paths = fill_decomposed(polygon, distance, regions, generate_path, merge_separate, boundaries, cut_lines, executor, budget, cache, "S")
 
-        if isocontours:
+                for path in paths:
+                    yield from (path if cache is None else translate_paths(path, offset))
 
-            path = generate_total_path(isocontours[boundaries:], distance)
+                continue
 
-            total_path.extend(path)
+            # the cache and the pool need the whole tree, otherwise the isocontours are generated while the path is built
+            if cache is None and executor is None:
+                isocontours = None
+            elif cache is None:
+                isocontours = ContourTree.from_polygon(polygon, distance, boundaries)
+            else:
+                # nested lists so each branch is cached too
+                isocontours = ([polygon.exterior] + cache.isocontours(polygon, distance))[boundaries:]
 
-    return total_path
\ No newline at end of file
+            if isocontours is None:
+                path = reduce_lazy(polygon, distance, generate_path, merge_separate, boundaries, budget=budget)
+            else:
+                path = generate_total_path(isocontours, distance, cache, budget=budget, executor=executor)
+
+            if not cache is None:
+                path = translate_paths(path, offset)
+
+            yield from path
+
+
+'''
+Generate the spiral fill
+'''
+def execute(polygons, distance, boundaries=0, cache=None, budget=None, workers=None, islands=None, regions=None, cut_lines=False):
+    return list(iter_execute(polygons, distance, boundaries, cache, budget, workers, islands, regions=regions, cut_lines=cut_lines))
@@ -0,0 +1,142 @@
+'''
+Generate paths for a stack of slice images (one image per layer)
+
+Consecutive slices that are identical (or nearly identical) reuse the paths of the previous slice.
+The distinct slices are processed in parallel and streamed out in layer order
+'''
+
+import os
+import hashlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from shapely_conversion import convert
+from cache import ResultCache
+from engine import configure, current_settings, settings_namespace
+
+import spiral as S
+import fermat_spiral as FS
+import integer_grid as G
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+'''
+Load a stack of grayscale slices from a directory (sorted by filename) or a multi-page TIFF
+'''
+def load_stack(path):
+
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+        images = [cv2.imread(os.path.join(path, n), 0) for n in names]
+    else:
+        ok, images = cv2.imreadmulti(path, flags=cv2.IMREAD_GRAYSCALE)
+        assert ok
+
+    assert images and all(not image is None for image in images)
+
+    return images
+
+
+'''
+Hash of the slice pixels ~ identical slices have the same hash
+'''
+def slice_hash(image):
+
+    h = hashlib.sha1(str(image.shape).encode())
+    h.update(np.ascontiguousarray(image).tobytes())
+
+    return h.hexdigest()
+
+
+'''
+Fraction of pixels that differ between two slices
+'''
+def slice_difference(a, b):
+
+    if a.shape != b.shape:
+        return 1.0
+
+    return np.count_nonzero(a != b) / a.size
+
+
+'''
+Find which layer provides the paths of each layer ~ a layer reuses the last distinct layer if it is identical or within the tolerance
+'''
+def find_sources(images, tolerance=0):
+
+    sources = []
+
+    previous = None
+
+    for i, image in enumerate(images):
+
+        h = slice_hash(image)
+
+        if not previous is None:
+
+            p, p_hash = previous
+
+            if h == p_hash or (tolerance > 0 and slice_difference(image, images[p]) <= tolerance):
+                sources.append(p)
+                continue
+
+        previous = (i, h)
+        sources.append(i)
+
+    return sources
+
+
+'''
+Generate the paths of a single slice with the current settings ~ polygons are put on the grid in grid mode
+'''
+def generate_layer(image, distance, method="CFS", optimize=False, cache_dir=None):
+
+    polygons = convert(image, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=optimize, simplify=1)
+
+    if not G.GRID_SCALE is None:
+        polygons = G.snap(polygons, G.GRID_SCALE)
+
+    # each worker has its own memory cache, the disk cache is shared between workers
+    cache = None if cache_dir is None else ResultCache(cache_dir, namespace=settings_namespace(current_settings()))
+
+    if method == "S":
+        return S.execute(polygons, distance, cache=cache)
+    elif method == "FS":
+        return FS.execute(polygons, distance, connected=False, cache=cache)
+    elif method == "CFS":
+        return FS.execute(polygons, distance, connected=True, cache=cache)
+
+    raise NotImplementedError("SPIRAL TYPE NOT INPUT")
+
+
+'''
+Generate the paths of every layer in the stack ~ yields the paths of each layer in order
+
+The distinct slices are generated in parallel with the settings of the caller, and repeated slices yield the paths of their source layer
+'''
+def generate_layers(images, distance, method="CFS", optimize=False, tolerance=0, workers=None, cache_dir=None):
+
+    sources = find_sources(images, tolerance)
+
+    # the last layer that uses each source ~ the paths are released after it
+    last_use = {source: i for i, source in enumerate(sources)}
+
+    # the workers are configured once when they start
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure, initargs=(current_settings(),)) as executor:
+
+        futures = {i: executor.submit(generate_layer, images[i], distance, method, optimize, cache_dir) for i in last_use}
+
+        for i, source in enumerate(sources):
+
+            # this waits in layer order, so output can be written while later layers are still generating
+            paths = futures[source].result()
+
+            if last_use[source] == i:
+                del futures[source]
+
+            yield paths
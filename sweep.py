@@ -0,0 +1,186 @@
+'''
+Run the path generation over several line distances while sharing the work between them
+
+The image is converted (and optimized) once. The isocontours of a distance that is an integer multiple
+of a smaller distance in the sweep are taken from the levels of the smaller distance instead of being
+offset again, and the path generation of each distance runs in parallel
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import cv2
+
+from shapely_conversion import convert
+from shapely_utilities import distance_transform_diff
+
+import spiral as S
+import fermat_spiral as FS
+
+from metrics import Metrics
+
+
+'''
+Keep every k-th level of an isocontour tree
+ - level is the depth of the first contour of the branch
+ - levels d*k are (up to the mitre join approximation) the levels of the tree at d that are a multiple of k
+ - a branch with only one remaining child branch is merged into its parent, since the larger distance would not split there
+'''
+def subsample_levels(isocontours, k, level=0):
+
+    result = []
+    branches = []
+
+    for item in isocontours:
+        if type(item) is list:
+            branch = subsample_levels(item, k, level)
+
+            # a branch with no levels left splits again before its first level, so its branches are siblings here
+            if branch and type(branch[0]) is list:
+                branches.extend(branch)
+            elif branch:
+                branches.append(branch)
+        else:
+            if level % k == 0:
+                result.append(item)
+            level += 1
+
+    if len(branches) == 1:
+        result.extend(branches[0])
+    else:
+        result.extend(branches)
+
+    return result
+
+
+'''
+Find the distance in the sweep that each distance can reuse the isocontours of ~ returns {distance: (base, k)}
+'''
+def find_bases(distances, tolerance=1e-9):
+
+    bases = {}
+
+    for d in sorted(distances):
+
+        bases[d] = (d, 1)
+
+        for base in sorted(distances):
+
+            if base >= d or bases[base][1] != 1:
+                continue
+
+            k = round(d / base)
+
+            if k > 1 and abs(d - k*base) < tolerance:
+                bases[d] = (base, k)
+                break
+
+    return bases
+
+
+'''
+Generate the paths of one distance from the isocontour trees of each polygon
+ - runs in a worker with a copy of the cache and a fork of the budget ~ returns the fallbacks recorded by the fork
+'''
+def generate(polygons, trees, distance, method, cache=None, budget=None):
+
+    start = perf_counter()
+
+    total_path = []
+
+    if not budget is None:
+        budget = budget.fork()
+
+    for i, (polygon, tree) in enumerate(zip(polygons, trees)):
+
+        if not budget is None:
+            budget.start(i)
+
+        isocontours = [polygon.exterior] + tree
+
+        if method == "S":
+            total_path.extend(S.generate_total_path(isocontours, distance, cache, budget=budget))
+        elif method == "FS":
+            total_path.extend(FS.generate_total_path(isocontours, distance, cache, budget=budget))
+        elif method == "CFS":
+            total_path.append(FS.generate_total_path_connected(isocontours, distance, cache, budget=budget))
+        else:
+            raise NotImplementedError("SPIRAL TYPE NOT INPUT")
+
+    if method == "CFS":
+        total_path = FS.clean_connected(total_path)
+
+    fallbacks = [] if budget is None else budget.fallbacks
+
+    return total_path, perf_counter() - start, fallbacks
+
+
+'''
+Compute the isocontour trees of every polygon at one distance
+'''
+def isocontour_trees(polygons, distance):
+    return [distance_transform_diff(polygon, distance) for polygon in polygons]
+
+
+'''
+Run the sweep over a list of distances
+ - polygons: polygons converted from the image (conversion and optimization are shared by every distance)
+ - reuse: take the isocontours of multiples of a smaller distance from its levels
+ - cache: ResultCache of the paths ~ the workers share the entries on disk, an in-memory cache only lives in each worker
+ - budget: per polygon budget of the start index retries, the fallbacks of every distance are added to it
+ - returns {distance: total path} and a table (list of dictionaries) of metrics
+'''
+def sweep(polygons, distances, method="CFS", reuse=True, workers=None, metrics=None, filename="", cache=None, budget=None):
+
+    distances = sorted(set(float(d) for d in distances))
+
+    bases = find_bases(distances) if reuse else {d: (d, 1) for d in distances}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        # offset the base distances in parallel
+        base_distances = [d for d in distances if bases[d][1] == 1]
+        futures = {d: executor.submit(isocontour_trees, polygons, d) for d in base_distances}
+        trees = {d: futures[d].result() for d in base_distances}
+
+        # derive the multiples from the levels of their base
+        for d in distances:
+            base, k = bases[d]
+
+            if k > 1:
+                trees[d] = [subsample_levels(tree, k, level=1) for tree in trees[base]]
+
+        # generate the paths of every distance in parallel
+        futures = {d: executor.submit(generate, polygons, trees[d], d, method, cache, budget) for d in distances}
+        results = {d: futures[d].result() for d in distances}
+
+    if not budget is None:
+        for d in distances:
+            budget.fallbacks.extend(results[d][2])
+
+    if metrics is None:
+        metrics = Metrics(segments=True, commands=True, curvature=False, underfill=True, overfill=True)
+
+    table = []
+
+    for d in distances:
+
+        total_path, duration, _ = results[d]
+
+        row = metrics.measure(total_path, filename, method, d, polygons)
+        row["Base"] = bases[d][0]
+        row["Time"] = duration
+
+        table.append(row)
+
+    return {d: results[d][0] for d in distances}, table
+
+
+'''
+Convert the image once and run the sweep
+'''
+def sweep_image(image, distances, method="CFS", optimize=False, reuse=True, workers=None, filename=""):
+
+    polygons = convert(image, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=optimize, simplify=1)
+
+    return sweep(polygons, distances, method, reuse, workers, filename=filename)
@@ -0,0 +1,231 @@
+'''
+Tiled ingestion of large images
+
+convert runs findContours on the whole image, so the full raster has to be in memory. Here the image is read
+in tiles that overlap by one pixel (the first row and column of the next tile), and the contours of each tile
+are converted into polygons in parallel. A polygon that does not reach a seam is a whole shape, the same as the
+one convert finds. The shapes that reach a seam are traced again from the raster: every shape that crosses a
+seam has pixels on its shared pixel line, so each foreground pixel on a seam line seeds a window that grows
+until it holds the whole connected shape, and the contours of that shape alone are found in the window
+
+The pixel contours touch themselves, so joining the pieces with a geometric union needs them repaired first,
+which fills holes and overlaps the results. Tracing the shape again gives the polygon convert gives, holes
+included. A shape is read back over its own bounding box, so a single shape that covers most of the image
+is read at once
+
+A .npy file is memory-mapped, so only the tiles being converted are read from disk. Other formats are read
+with OpenCV
+'''
+
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import shapely
+
+from shapely_conversion import generate_border_lines, create_contour_families
+from optimization import optimize_polygon
+
+
+'''
+Open a grayscale raster ~ .npy files are memory-mapped instead of read
+'''
+def open_raster(filename):
+
+    if os.path.splitext(filename)[1].lower() == ".npy":
+        raster = np.load(filename, mmap_mode="r")
+    else:
+        raster = cv2.imread(filename, 0)
+
+    assert not raster is None and raster.ndim == 2
+
+    return raster
+
+
+'''
+Get the bounds (x0, y0, x1, y1) of each tile ~ every tile but the last in a row or column has one extra pixel of overlap
+'''
+def tile_bounds(shape, tile_size):
+
+    assert tile_size > 1
+
+    height, width = shape
+
+    return [(x0, y0, min(x0 + tile_size + 1, width), min(y0 + tile_size + 1, height))
+            for y0 in range(0, height, tile_size) for x0 in range(0, width, tile_size)]
+
+
+'''
+Convert the contours of one tile into polygons in image coordinates
+ - raster: the raster, or the filename of a .npy raster so a worker maps the file itself instead of receiving the pixels
+'''
+def tile_polygons(raster, bounds, approximation = cv2.CHAIN_APPROX_SIMPLE):
+
+    if type(raster) is str:
+        raster = open_raster(raster)
+
+    x0, y0, x1, y1 = bounds
+
+    tile = np.ascontiguousarray(raster[y0:y1, x0:x1])
+
+    coords, offsets, heirarchy = generate_border_lines(tile, approximation)
+
+    return create_contour_families(coords + (x0, y0), offsets, heirarchy)
+
+
+'''
+Find the connected shape of a seed pixel ~ returns the window (x0, y0, x1, y1) that holds the whole shape and its mask in the window
+ - the window starts a margin around the seed and grows by the margin past every side the shape reaches
+'''
+def shape_window(raster, x, y, margin):
+
+    height, width = raster.shape
+
+    x0, y0, x1, y1 = max(x - margin, 0), max(y - margin, 0), min(x + margin + 1, width), min(y + margin + 1, height)
+
+    while True:
+
+        window = np.ascontiguousarray(raster[y0:y1, x0:x1])
+
+        # findContours joins the foreground pixels of a shape by 8-connectivity
+        _, labels = cv2.connectedComponents((window > 0).astype(np.uint8), connectivity=8)
+        mask = labels == labels[y - y0, x - x0]
+
+        rows = np.flatnonzero(mask.any(axis=1))
+        columns = np.flatnonzero(mask.any(axis=0))
+
+        # the shape is whole once it does not reach a side of the window that is not a side of the image
+        grow = (columns[0] == 0 and x0 > 0, rows[0] == 0 and y0 > 0, columns[-1] == x1 - x0 - 1 and x1 < width, rows[-1] == y1 - y0 - 1 and y1 < height)
+
+        if not any(grow):
+            return (x0, y0, x1, y1), mask
+
+        x0, y0, x1, y1 = (max(x0 + columns[0] - margin, 0) if grow[0] else x0,
+                          max(y0 + rows[0] - margin, 0) if grow[1] else y0,
+                          min(x0 + columns[-1] + margin + 1, width) if grow[2] else x1,
+                          min(y0 + rows[-1] + margin + 1, height) if grow[3] else y1)
+
+
+'''
+Trace the shapes that reach a tile seam again from the raster ~ returns the polygons of the shapes
+ - seams: x and y positions of the shared pixel lines
+ - each shape is traced once, the other seeds on it are dropped
+'''
+def trace_seams(raster, seams_x, seams_y, margin, approximation = cv2.CHAIN_APPROX_SIMPLE):
+
+    # foreground pixels on the seam lines ~ only these lines are read
+    seeds = [(x, y) for x in seams_x for y in np.flatnonzero(raster[:, x])]
+    seeds += [(x, y) for y in seams_y for x in np.flatnonzero(raster[y, :])]
+
+    if not seeds:
+        return []
+
+    seeds = np.asarray(seeds, dtype=np.int64)
+    done = np.zeros(len(seeds), dtype=bool)
+
+    polygons = []
+
+    for i, (x, y) in enumerate(seeds):
+
+        if done[i]:
+            continue
+
+        (x0, y0, x1, y1), mask = shape_window(raster, x, y, margin)
+
+        coords, offsets, heirarchy = generate_border_lines(mask.astype(np.uint8), approximation)
+        polygons.extend(create_contour_families(coords + (x0, y0), offsets, heirarchy))
+
+        # seeds on the same shape
+        inside = (seeds[:,0] >= x0) & (seeds[:,0] < x1) & (seeds[:,1] >= y0) & (seeds[:,1] < y1)
+        done[inside] |= mask[seeds[inside,1] - y0, seeds[inside,0] - x0]
+
+    return polygons
+
+
+'''
+Keep the polygons that do not reach a tile seam
+ - seams: x and y positions of the shared pixel lines
+'''
+def inside_tiles(polygons, seams_x, seams_y):
+
+    if not polygons:
+        return []
+
+    polygons = np.asarray(polygons, dtype=object)
+
+    bounds = shapely.bounds(polygons)
+
+    # a polygon reaches a seam if the seam is within its bounds
+    def reaches(low, high, seams):
+        return np.searchsorted(seams, low, side="left") != np.searchsorted(seams, high, side="right")
+
+    seam = reaches(bounds[:,0], bounds[:,2], seams_x) | reaches(bounds[:,1], bounds[:,3], seams_y)
+
+    return list(polygons[~seam])
+
+
+'''
+Convert a large image into a list of shapely polygons, one tile at a time
+ - same arguments as convert, with the tile size in pixels and the number of processes to convert the tiles with
+'''
+def convert_tiled(filename, tile_size, approximation = cv2.CHAIN_APPROX_SIMPLE, optimize=False, simplify=1, workers=None):
+
+    assert simplify >= 0
+
+    raster = open_raster(filename)
+
+    bounds = tile_bounds(raster.shape, tile_size)
+
+    # workers map the file themselves if it is memory-mapped
+    source = filename if isinstance(raster, np.memmap) else raster
+
+    if workers is None:
+        tiles = [tile_polygons(raster, b, approximation) for b in bounds]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tiles = list(executor.map(tile_polygons, [source] * len(bounds), bounds, [approximation] * len(bounds)))
+
+    height, width = raster.shape
+
+    seams_x = np.arange(tile_size, width, tile_size)
+    seams_y = np.arange(tile_size, height, tile_size)
+
+    # the pieces of the shapes on a seam are replaced by the whole shapes
+    polygons = inside_tiles([p for tile in tiles for p in tile], seams_x, seams_y) + trace_seams(raster, seams_x, seams_y, tile_size, approximation)
+
+    if optimize:
+        polygons = [optimize_polygon(polygon) for polygon in polygons]
+
+    if simplify > 0:
+        polygons = list(shapely.simplify(polygons, simplify))
+
+    return polygons
+
+
+'''
+Compare tiled polygons with the polygons of convert by the coverage of sample points ~ returns a dictionary of the error
+ - a sample point is covered if any polygon contains it
+'''
+def tiled_error(full, tiled, samples=100000, seed=0):
+
+    minx, miny, maxx, maxy = shapely.total_bounds(full + tiled)
+
+    points = np.random.default_rng(seed).uniform((minx, miny), (maxx, maxy), (samples, 2))
+
+    def coverage(polygons):
+
+        covered = np.zeros(samples, dtype=bool)
+
+        for polygon in polygons:
+            covered |= shapely.contains_xy(polygon, points[:,0], points[:,1])
+
+        return covered
+
+    return {
+        "Polygons": len(tiled),
+        "Full Polygons": len(full),
+        "Differing Points": int(np.count_nonzero(coverage(full) != coverage(tiled))),
+    }
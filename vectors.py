@@ -0,0 +1,547 @@
+'''
+Load vector drawings straight into shapely polygons
+
+Parts drawn in CAD do not need to be rasterized and traced again. These loaders turn SVG, DXF, WKB and GeoJSON
+files into the list of polygons that spiral.execute and fermat_spiral.execute expect:
+ - SVG: path, polygon, polyline, rect, circle and ellipse elements (with their transforms), curves are flattened
+ - DXF (ASCII): LWPOLYLINE, POLYLINE, CIRCLE, ELLIPSE, ARC and LINE entities, open pieces are joined into closed loops
+ - WKB: a single binary geometry, or one hex encoded geometry per line (decoded in one call)
+ - GeoJSON: a geometry, feature or feature collection
+
+Closed rings are nested by the even-odd rule, so a ring inside a ring is a hole and a ring inside a hole is a new polygon.
+The coordinates are kept in the units of the file, so the line distance is given in the same units
+'''
+
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+import shapely
+from shapely import STRtree
+
+
+'''
+Split geometries into their polygons ~ nested collections are split until only single geometries are left
+'''
+def polygon_parts(geometries):
+
+    parts = shapely.get_parts(np.atleast_1d(np.asarray(geometries, dtype=object)))
+
+    # multi part types and collections
+    while np.any(np.isin(shapely.get_type_id(parts), [4, 5, 6, 7])):
+        parts = shapely.get_parts(parts)
+
+    return [p for p in parts if p.geom_type == "Polygon" and not p.is_empty]
+
+
+'''
+Build polygons from closed rings with the even-odd rule
+ - rings: list of (N,2) coordinate arrays, the rings must not cross each other
+ - a ring inside an odd number of rings is a hole of the smallest ring around it
+'''
+def nest_rings(rings):
+
+    rings = [np.asarray(r, dtype=float) for r in rings if len(r) >= 3]
+
+    if not rings:
+        return []
+
+    shells = shapely.polygons(shapely.linearrings(np.concatenate(rings), indices=np.repeat(np.arange(len(rings)), [len(r) for r in rings])))
+
+    # a vertex is on its own ring (not within it) and within every ring around it
+    vertices = shapely.points([r[0] for r in rings])
+    inner, outer = STRtree(shells).query(vertices, predicate="within")
+
+    depth = np.bincount(inner, minlength=len(rings))
+
+    # the ring directly around each ring is the deepest one around it
+    parent = np.full(len(rings), -1)
+    direct = depth[outer] == depth[inner] - 1
+    parent[inner[direct]] = outer[direct]
+
+    polygons = []
+
+    for i in np.flatnonzero(depth % 2 == 0):
+        holes = [rings[j] for j in np.flatnonzero((parent == i) & (depth % 2 == 1))]
+        polygons.append(shapely.Polygon(rings[i], holes))
+
+    return polygons
+
+
+PATH_TOKEN = re.compile(r"[MmLlHhVvCcSsQqTtAaZz]|[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?")
+NUMBER = re.compile(r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?")
+
+# number of arguments of each path command
+PATH_ARGUMENTS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7}
+
+
+'''
+Get the numbers in an attribute ~ units are dropped
+'''
+def svg_numbers(text):
+    return [float(n) for n in NUMBER.findall(text or "")]
+
+
+'''
+Get a single length attribute of an element (0 if it is missing)
+'''
+def svg_length(element, name):
+
+    numbers = svg_numbers(element.get(name))
+
+    return numbers[0] if numbers else 0
+
+
+'''
+Points along a cubic bezier, without the start point
+'''
+def cubic_points(p0, c1, c2, p1, segments):
+
+    t = np.linspace(0, 1, segments + 1)[1:]
+
+    return (1-t)**3 * p0 + 3*(1-t)**2*t * c1 + 3*(1-t)*t**2 * c2 + t**3 * p1
+
+
+'''
+Points along a quadratic bezier, without the start point
+'''
+def quadratic_points(p0, c, p1, segments):
+
+    t = np.linspace(0, 1, segments + 1)[1:]
+
+    return (1-t)**2 * p0 + 2*(1-t)*t * c + t**2 * p1
+
+
+'''
+Points along an SVG elliptical arc, without the start point ~ the endpoint parameters are converted to a center (SVG 1.1 F.6.5)
+'''
+def arc_points(p0, rx, ry, phi, large, sweep, p1, segments):
+
+    if rx == 0 or ry == 0 or p0 == p1:
+        return np.array([p1])
+
+    rx, ry = abs(rx), abs(ry)
+
+    rotation = np.exp(1j * np.radians(phi))
+
+    d = (p0 - p1) / 2 / rotation
+    x1, y1 = d.real, d.imag
+
+    # radii too small to reach the end are scaled up
+    scale = (x1/rx)**2 + (y1/ry)**2
+
+    if scale > 1:
+        rx, ry = rx * np.sqrt(scale), ry * np.sqrt(scale)
+
+    numerator = rx**2 * ry**2 - rx**2 * y1**2 - ry**2 * x1**2
+    denominator = rx**2 * y1**2 + ry**2 * x1**2
+
+    coef = np.sqrt(max(0, numerator / denominator)) * (-1 if large == sweep else 1)
+
+    center = complex(coef * rx * y1 / ry, -coef * ry * x1 / rx)
+
+    theta1 = np.angle(complex((x1 - center.real) / rx, (y1 - center.imag) / ry))
+    theta2 = np.angle(complex((-x1 - center.real) / rx, (-y1 - center.imag) / ry))
+
+    delta = theta2 - theta1
+
+    if sweep and delta < 0:
+        delta += 2 * np.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * np.pi
+
+    t = theta1 + delta * np.linspace(0, 1, segments + 1)[1:]
+
+    return (rx * np.cos(t) + 1j * ry * np.sin(t)) * rotation + center * rotation + (p0 + p1) / 2
+
+
+'''
+Convert an SVG path into closed rings ~ returns a list of complex point arrays (open subpaths are closed like an SVG fill)
+'''
+def parse_path(d, segments=16):
+
+    tokens = PATH_TOKEN.findall(d)
+
+    rings = []
+    current = []
+
+    position = start = 0j
+    command = None
+
+    # last control point of a cubic or quadratic command, for the smooth commands that reflect it
+    last_cubic = last_quadratic = None
+
+    i = 0
+
+    while i < len(tokens):
+
+        if tokens[i].isalpha():
+            command = tokens[i]
+            i += 1
+
+            if command in "Zz":
+                if len(current) > 2:
+                    rings.append(np.array(current))
+
+                # a subpath that goes on without a move starts again at the start of the closed one
+                current = [start]
+                position = start
+                continue
+
+        name = command.upper()
+        base = 0j if command.isupper() else position
+
+        args = [float(t) for t in tokens[i:i + PATH_ARGUMENTS[name]]]
+        i += PATH_ARGUMENTS[name]
+
+        points = []
+        cubic = quadratic = None
+
+        if name == "M":
+            if len(current) > 2:
+                rings.append(np.array(current))
+
+            position = start = base + complex(*args)
+            current = [position]
+
+            # coordinates after a move are lines
+            command = "L" if command.isupper() else "l"
+            continue
+
+        elif name == "L":
+            points = [base + complex(*args)]
+        elif name == "H":
+            points = [complex(args[0] + base.real, position.imag)]
+        elif name == "V":
+            points = [complex(position.real, args[0] + base.imag)]
+        elif name == "C":
+            c1, cubic, end = base + complex(*args[0:2]), base + complex(*args[2:4]), base + complex(*args[4:6])
+            points = cubic_points(position, c1, cubic, end, segments)
+        elif name == "S":
+            c1 = 2 * position - last_cubic if not last_cubic is None else position
+            cubic, end = base + complex(*args[0:2]), base + complex(*args[2:4])
+            points = cubic_points(position, c1, cubic, end, segments)
+        elif name == "Q":
+            quadratic, end = base + complex(*args[0:2]), base + complex(*args[2:4])
+            points = quadratic_points(position, quadratic, end, segments)
+        elif name == "T":
+            quadratic = 2 * position - last_quadratic if not last_quadratic is None else position
+            end = base + complex(*args)
+            points = quadratic_points(position, quadratic, end, segments)
+        elif name == "A":
+            points = arc_points(position, args[0], args[1], args[2], bool(args[3]), bool(args[4]), base + complex(*args[5:7]), segments)
+
+        last_cubic, last_quadratic = cubic, quadratic
+
+        current.extend(points)
+        position = current[-1]
+
+    if len(current) > 2:
+        rings.append(np.array(current))
+
+    return rings
+
+
+'''
+Parse an SVG transform attribute into a 3x3 matrix
+'''
+def parse_transform(text):
+
+    matrix = np.eye(3)
+
+    for name, values in re.findall(r"(\w+)\s*\(([^)]*)\)", text or ""):
+
+        v = svg_numbers(values)
+
+        if name == "matrix":
+            m = np.array([[v[0], v[2], v[4]], [v[1], v[3], v[5]], [0, 0, 1]])
+        elif name == "translate":
+            m = np.array([[1, 0, v[0]], [0, 1, v[1] if len(v) > 1 else 0], [0, 0, 1]])
+        elif name == "scale":
+            m = np.diag([v[0], v[1] if len(v) > 1 else v[0], 1])
+        elif name == "rotate":
+            a = np.radians(v[0])
+            cx, cy = v[1:3] if len(v) > 2 else (0, 0)
+            m = np.array([[np.cos(a), -np.sin(a), cx - cx*np.cos(a) + cy*np.sin(a)], [np.sin(a), np.cos(a), cy - cx*np.sin(a) - cy*np.cos(a)], [0, 0, 1]])
+        elif name == "skewX":
+            m = np.array([[1, np.tan(np.radians(v[0])), 0], [0, 1, 0], [0, 0, 1]])
+        elif name == "skewY":
+            m = np.array([[1, 0, 0], [np.tan(np.radians(v[0])), 1, 0], [0, 0, 1]])
+        else:
+            continue
+
+        matrix = matrix @ m
+
+    return matrix
+
+
+'''
+Get the rings of a single SVG shape element ~ complex point arrays
+'''
+def element_rings(element, segments=16):
+
+    tag = element.tag.split("}")[-1]
+
+    if tag == "path":
+        return parse_path(element.get("d", ""), segments)
+
+    if tag in ("polygon", "polyline"):
+        v = svg_numbers(element.get("points"))
+        return [np.array(v[0:len(v)//2*2:2]) + 1j * np.array(v[1:len(v)//2*2:2])]
+
+    if tag == "rect":
+        x, y, w, h = [svg_length(element, name) for name in ("x", "y", "width", "height")]
+        return [np.array([x + 1j*y, x + w + 1j*y, x + w + 1j*(y + h), x + 1j*(y + h)])]
+
+    if tag in ("circle", "ellipse"):
+        rx = svg_length(element, "r" if tag == "circle" else "rx")
+        ry = svg_length(element, "r" if tag == "circle" else "ry")
+        t = np.linspace(0, 2*np.pi, 4 * segments, endpoint=False)
+        return [svg_length(element, "cx") + 1j*svg_length(element, "cy") + rx*np.cos(t) + 1j*ry*np.sin(t)]
+
+    return []
+
+
+'''
+Load the shapes of an SVG file as polygons
+ - segments: number of line segments each curve is flattened into
+'''
+def load_svg(filename, segments=16):
+
+    root = ElementTree.parse(filename).getroot()
+
+    rings = []
+
+    stack = [(root, np.eye(3))]
+
+    while stack:
+        element, parent = stack.pop()
+
+        # definitions are only drawn where they are used
+        if element.tag.split("}")[-1] in ("defs", "clipPath", "mask", "symbol", "marker", "pattern"):
+            continue
+
+        matrix = parent @ parse_transform(element.get("transform"))
+
+        for ring in element_rings(element, segments):
+            points = matrix @ np.vstack([ring.real, ring.imag, np.ones(len(ring))])
+            rings.append(points[:2].T)
+
+        stack.extend((child, matrix) for child in reversed(list(element)))
+
+    return nest_rings(rings)
+
+
+'''
+Points along a polyline segment with a bulge (the tangent of a quarter of the arc angle), without the start point
+'''
+def bulge_points(p0, p1, bulge, segments):
+
+    if bulge == 0 or p0 == p1:
+        return np.array([p1])
+
+    theta = 4 * np.arctan(bulge)
+
+    chord = p1 - p0
+    center = p0 + chord / 2 + 1j * chord / 2 / np.tan(theta / 2)
+
+    return center + (p0 - center) * np.exp(1j * theta * np.linspace(0, 1, segments + 1)[1:])
+
+
+'''
+Read the entities of an ASCII DXF file ~ returns a list of (entity type, list of (group code, value))
+'''
+def dxf_entities(filename):
+
+    with open(filename, errors="replace") as f:
+        lines = [line.strip() for line in f]
+
+    pairs = [(int(code), value) for code, value in zip(lines[0::2], lines[1::2]) if code.lstrip("-").isdigit()]
+
+    entities = []
+    in_entities = False
+
+    for i, (code, value) in enumerate(pairs):
+
+        if code == 2 and value == "ENTITIES" and i > 0 and pairs[i-1] == (0, "SECTION"):
+            in_entities = True
+        elif code == 0 and value == "ENDSEC":
+            in_entities = False
+        elif in_entities and code == 0:
+            entities.append((value, []))
+        elif in_entities and entities:
+            entities[-1][1].append((code, value))
+
+    return entities
+
+
+'''
+Get the first value of a group code in an entity
+'''
+def dxf_value(groups, code, default=0.0):
+
+    for c, value in groups:
+        if c == code:
+            return float(value)
+
+    return default
+
+
+'''
+Convert polyline vertices (x, y, bulge) into complex points
+'''
+def polyline_points(vertices, closed, segments):
+
+    points = [complex(*vertices[0][:2])]
+
+    pairs = list(zip(vertices, vertices[1:] + (vertices[:1] if closed else [])))
+
+    for (x0, y0, bulge), (x1, y1, _) in pairs:
+        points.extend(bulge_points(complex(x0, y0), complex(x1, y1), bulge, segments))
+
+    return np.array(points)
+
+
+'''
+Load the closed shapes of an ASCII DXF file as polygons
+ - segments: number of line segments each arc is flattened into
+'''
+def load_dxf(filename, segments=16):
+
+    rings = []
+
+    # open pieces (lines, arcs and open polylines) are joined into loops at the end
+    pieces = []
+
+    polyline = None
+
+    for kind, groups in dxf_entities(filename):
+
+        if kind == "LWPOLYLINE":
+            vertices = []
+
+            for code, value in groups:
+                if code == 10:
+                    vertices.append([float(value), 0.0, 0.0])
+                elif code == 20 and vertices:
+                    vertices[-1][1] = float(value)
+                elif code == 42 and vertices:
+                    vertices[-1][2] = float(value)
+
+            closed = int(dxf_value(groups, 70)) & 1
+
+            if len(vertices) > 1:
+                (rings if closed else pieces).append(polyline_points([tuple(v) for v in vertices], closed, segments))
+
+        elif kind == "POLYLINE":
+            polyline = (int(dxf_value(groups, 70)) & 1, [])
+
+        elif kind == "VERTEX" and not polyline is None:
+            polyline[1].append((dxf_value(groups, 10), dxf_value(groups, 20), dxf_value(groups, 42)))
+
+        elif kind == "SEQEND" and not polyline is None:
+            closed, vertices = polyline
+
+            if len(vertices) > 1:
+                (rings if closed else pieces).append(polyline_points(vertices, closed, segments))
+
+            polyline = None
+
+        elif kind == "CIRCLE":
+            t = np.linspace(0, 2*np.pi, 4 * segments, endpoint=False)
+            rings.append(complex(dxf_value(groups, 10), dxf_value(groups, 20)) + dxf_value(groups, 40) * np.exp(1j * t))
+
+        elif kind == "ELLIPSE":
+            center = complex(dxf_value(groups, 10), dxf_value(groups, 20))
+            major = complex(dxf_value(groups, 11), dxf_value(groups, 21))
+            start, end = dxf_value(groups, 41), dxf_value(groups, 42, 2*np.pi)
+
+            if end <= start:
+                end += 2*np.pi
+
+            t = np.linspace(start, end, 4 * segments + 1)
+            points = center + major * (np.cos(t) + 1j * dxf_value(groups, 40, 1.0) * np.sin(t))
+
+            if np.isclose(end - start, 2*np.pi):
+                rings.append(points[:-1])
+            else:
+                pieces.append(points)
+
+        elif kind == "ARC":
+            center = complex(dxf_value(groups, 10), dxf_value(groups, 20))
+            start, end = np.radians(dxf_value(groups, 50)), np.radians(dxf_value(groups, 51))
+
+            if end <= start:
+                end += 2*np.pi
+
+            pieces.append(center + dxf_value(groups, 40) * np.exp(1j * np.linspace(start, end, segments + 1)))
+
+        elif kind == "LINE":
+            pieces.append(np.array([complex(dxf_value(groups, 10), dxf_value(groups, 20)), complex(dxf_value(groups, 11), dxf_value(groups, 21))]))
+
+    rings = [np.column_stack([r.real, r.imag]) for r in rings]
+
+    if pieces:
+        lines = shapely.linestrings(np.concatenate([np.column_stack([p.real, p.imag]) for p in pieces]), indices=np.repeat(np.arange(len(pieces)), [len(p) for p in pieces]))
+
+        # endpoints are snapped to the nearest thousandth so the pieces of a loop meet
+        loops = shapely.get_parts(shapely.polygonize(shapely.set_precision(lines, 1e-3)))
+        rings.extend(shapely.get_coordinates(loop.exterior) for loop in loops)
+
+    return nest_rings(rings)
+
+
+'''
+Load a WKB file as polygons ~ a single binary geometry, or one hex encoded geometry per line decoded in one call
+'''
+def load_wkb(filename):
+
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    if re.fullmatch(rb"[0-9A-Fa-f\s]*", data):
+        geometries = shapely.from_wkb(np.array(data.split(), dtype=object))
+    else:
+        geometries = shapely.from_wkb(data)
+
+    return polygon_parts(geometries)
+
+
+'''
+Load a GeoJSON geometry, feature or feature collection as polygons
+'''
+def load_geojson(filename):
+
+    with open(filename) as f:
+        return polygon_parts(shapely.from_geojson(f.read()))
+
+
+LOADERS = {
+    ".svg": load_svg,
+    ".dxf": load_dxf,
+    ".wkb": load_wkb,
+    ".geojson": load_geojson,
+    ".json": load_geojson,
+}
+
+
+'''
+True if the file is a vector format with a loader
+'''
+def is_vector(filename):
+    return os.path.splitext(filename)[1].lower() in LOADERS
+
+
+'''
+Load the polygons of a vector file with the loader picked from its extension
+'''
+def load_vectors(filename):
+
+    extension = os.path.splitext(filename)[1].lower()
+
+    if not extension in LOADERS:
+        raise NotImplementedError("NO LOADER FOR " + extension)
+
+    return LOADERS[extension](filename)